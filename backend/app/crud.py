@@ -1,6 +1,9 @@
-from sqlalchemy.orm import Session
-from . import models
-from typing import Dict, Any
+from sqlalchemy import select, func, literal_column, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, load_only, selectinload
+from . import models, read_cache
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
 
 def get_all_systems(db: Session):
     return db.query(models.System).all()
@@ -87,19 +90,185 @@ def upsert_context_to_prod(dev_context: models.Context, prod_db: Session):
     prod_db.commit()
     return True
 
-def get_full_catalog_by_id(db: Session, tableid: int) -> Dict[str, Any]:
-    # Mocked join: in real code, join catalog, catalog_mapping, catalog_rules
-    catalog = db.query(models.Catalog).filter(models.Catalog.tableid == tableid).first()
-    # Mocked mapping and rules
-    catalog_mapping = {"roleid": 1, "categoryid": 2, "systemid": 3}
-    catalog_rules = [
-        {"rule": "Rule 1", "details": "Details 1"},
-        {"rule": "Rule 2", "details": "Details 2"}
-    ]
-    if not catalog:
-        return None
-    result = {**catalog.__dict__}
-    result.pop("_sa_instance_state", None)
-    result["mapping"] = catalog_mapping
-    result["rules_list"] = catalog_rules
-    return result 
\ No newline at end of file
+def get_full_catalog(db: Session, tableid: Optional[int] = None, table_vector_id: Optional[str] = None):
+    """Catalog with its mappings and samples, in three queries whatever the fan-out"""
+    query = db.query(models.Catalog).options(selectinload(models.Catalog.mappings), selectinload(models.Catalog.sample))
+    if tableid is not None:
+        return query.filter(models.Catalog.tableid == tableid).first()
+    return query.filter(models.Catalog.table_vector_id == table_vector_id).first()
+
+def get_context_by_vector_id(db: Session, context_vector_id: str):
+    return db.query(models.Context).filter(models.Context.context_vector_id == context_vector_id).first()
+
+def get_catalogs_by_table_names(db: Session, table_names: List[str]):
+    if not table_names:
+        return []
+    return db.query(models.Catalog).options(
+        load_only(models.Catalog.tableid, models.Catalog.table_vector_id, models.Catalog.table_name, models.Catalog.table_description, raiseload=True)
+    ).filter(models.Catalog.table_name.in_(table_names)).all()
+
+SYNC_CHUNK_SIZE = 500
+
+ENTITY_MODELS = {
+    "systems": models.System,
+    "roles": models.Role,
+    "categories": models.Category,
+    "catalogs": models.Catalog,
+    "contexts": models.Context,
+}
+
+def primary_key_column(model):
+    return model.__table__.primary_key.columns.values()[0]
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def get_rows_for_sync(db: Session, model, ids: Optional[List[int]] = None, updated_since: Optional[datetime] = None):
+    """Read dev rows as plain column mappings, chunking the IN list for large id sets"""
+    table = model.__table__
+    pk = primary_key_column(model)
+    query = select(table)
+    if updated_since is not None:
+        query = query.where(table.c.date_updated >= updated_since)
+    if ids is None:
+        return [dict(row) for row in db.execute(query.order_by(pk)).mappings()]
+    rows = []
+    for chunk in _chunks(ids, SYNC_CHUNK_SIZE):
+        rows.extend(dict(row) for row in db.execute(query.where(pk.in_(chunk)).order_by(pk)).mappings())
+    return rows
+
+def upsert_rows(model, rows: List[Dict[str, Any]], session: Session, chunk_size: int = SYNC_CHUNK_SIZE):
+    """One INSERT ... ON CONFLICT DO UPDATE per chunk, left uncommitted.
+
+    Returns a mapping of primary key to "inserted" or "updated".
+    """
+    table = model.__table__
+    pk = primary_key_column(model)
+    results = {}
+    for chunk in _chunks(rows, chunk_size):
+        stmt = insert(table).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[pk],
+            set_={c.name: stmt.excluded[c.name] for c in table.columns if not c.primary_key},
+        ).returning(pk, literal_column("xmax = 0").label("inserted"))
+        for row in session.execute(stmt):
+            results[row[0]] = "inserted" if row[1] else "updated"
+    return results
+
+def delete_rows(model, ids: List[int], session: Session, chunk_size: int = SYNC_CHUNK_SIZE) -> List[int]:
+    """Delete rows by primary key, left uncommitted; returns the ids that existed"""
+    pk = primary_key_column(model)
+    deleted = []
+    for chunk in _chunks(ids, chunk_size):
+        deleted.extend(session.execute(model.__table__.delete().where(pk.in_(chunk)).returning(pk)).scalars())
+    return deleted
+
+def bulk_upsert_to_prod(model, rows: List[Dict[str, Any]], prod_db: Session, chunk_size: int = SYNC_CHUNK_SIZE):
+    """Upsert rows chunk by chunk in a single transaction"""
+    try:
+        results = upsert_rows(model, rows, prod_db, chunk_size)
+        prod_db.commit()
+    except Exception:
+        prod_db.rollback()
+        raise
+    return results
+
+def sync_batch_to_prod(model, dev_db: Session, prod_db: Session, ids: Optional[List[int]] = None, updated_since: Optional[datetime] = None):
+    pk = primary_key_column(model)
+    rows = get_rows_for_sync(dev_db, model, ids, updated_since)
+    synced = bulk_upsert_to_prod(model, rows, prod_db)
+    versions = {row[pk.name]: row.get("date_updated") for row in rows}
+    requested = ids if ids is not None else [row[pk.name] for row in rows]
+    # "version" is the synced row's date_updated; SyncResult leaves it out of responses.
+    return [{"id": i, "status": synced.get(i, "not_found"), "version": versions.get(i)} for i in requested]
+
+STREAM_BATCH_SIZE = 1000
+
+def get_version_stamp(db: Session, model):
+    """(max date_updated, row count) of a table: changes whenever a row is added, removed or touched"""
+    table = model.__table__
+    return read_cache.cached(db.info.get("env"), (table.name,), ("stamp",), lambda: tuple(
+        db.execute(select(func.max(table.c.date_updated), func.count()).select_from(table)).one()
+    ))
+
+def get_page_rows(db: Session, model, columns: List[str], after: Optional[int] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Keyset page ordered by primary key as plain dicts of the given columns.
+
+    A Core select reads only those columns and builds no ORM instances.
+    Pages are served from the read cache; callers must not modify them.
+    """
+    table = model.__table__
+    pk = primary_key_column(model)
+    stmt = select(*[table.c[name] for name in columns])
+    if after is not None:
+        stmt = stmt.where(pk > after)
+    stmt = stmt.order_by(pk)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return read_cache.cached(db.info.get("env"), (table.name,), ("page", tuple(columns), after, limit), lambda: [
+        dict(zip(columns, row)) for row in db.execute(stmt)
+    ])
+
+def stream_rows(db: Session, model, columns: List[str], batch_size: int = STREAM_BATCH_SIZE):
+    """Yield row dicts through a server-side cursor, batch_size rows at a time"""
+    table = model.__table__
+    stmt = select(*[table.c[name] for name in columns]).order_by(primary_key_column(model)).execution_options(stream_results=True, yield_per=batch_size)
+    for row in db.execute(stmt):
+        yield dict(zip(columns, row))
+
+AUDIT_PAGE_SIZE = 100
+
+def get_record_history(db: Session, table_name: str, record_id: int, limit: Optional[int] = None):
+    query = db.query(models.TableAudit).filter(
+        models.TableAudit.table_name == table_name,
+        models.TableAudit.record_id == record_id
+    ).order_by(models.TableAudit.changed_at.desc(), models.TableAudit.audit_id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def get_table_history_page(db: Session, table_name: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                           before: Optional[Tuple[datetime, int]] = None, limit: int = AUDIT_PAGE_SIZE):
+    """Newest-first keyset page; before is the (changed_at, audit_id) of the last row already seen"""
+    query = db.query(models.TableAudit).filter(models.TableAudit.table_name == table_name)
+    if start_date:
+        query = query.filter(models.TableAudit.changed_at >= start_date)
+    if end_date:
+        query = query.filter(models.TableAudit.changed_at <= end_date)
+    if before:
+        # The plain changed_at bound lets Postgres prune partitions; the row
+        # comparison alone would not.
+        query = query.filter(
+            models.TableAudit.changed_at <= before[0],
+            tuple_(models.TableAudit.changed_at, models.TableAudit.audit_id) < tuple_(*before),
+        )
+    return query.order_by(models.TableAudit.changed_at.desc(), models.TableAudit.audit_id.desc()).limit(limit).all()
+
+LATEST_HISTORY_SQL = text("""
+    SELECT a.* FROM unnest(CAST(:record_ids AS integer[])) AS r(record_id)
+    CROSS JOIN LATERAL (
+        SELECT * FROM autobi.table_audit t
+        WHERE t.table_name = :table_name AND t.record_id = r.record_id
+        ORDER BY t.changed_at DESC, t.audit_id DESC
+        LIMIT :per_record
+    ) a
+    ORDER BY a.record_id, a.changed_at DESC, a.audit_id DESC
+""")
+
+def get_latest_history(db: Session, table_name: str, record_ids: List[int], per_record: int) -> Dict[int, List[models.TableAudit]]:
+    """Latest per_record entries for each record id, one index range scan per id in a single query"""
+    history = {record_id: [] for record_id in record_ids}
+    rows = db.query(models.TableAudit).from_statement(LATEST_HISTORY_SQL).params(
+        record_ids=list(history), table_name=table_name, per_record=per_record
+    )
+    for row in rows:
+        history[row.record_id].append(row)
+    return history
+
+def get_record_state(db: Session, table_name: str, record_id: int, audit_id: int):
+    model = models.AUDITED_MODELS[table_name]
+    return db.execute(
+        text("SELECT autobi.audit_row_state(:table_name, :record_key, :record_id, :audit_id)"),
+        {"table_name": table_name, "record_key": primary_key_column(model).name, "record_id": record_id, "audit_id": audit_id},
+    ).scalar()
@@ -1,6 +1,13 @@
 import os
-from sqlalchemy import create_engine
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, exc
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
 import urllib.parse
 load_dotenv()
@@ -17,11 +24,144 @@ def make_url(prefix):
     else:
         return f"postgresql://{user}@{host}:{port}/{dbname}"
 
-DEV_DB_URL = make_url("DEV")
-PROD_DB_URL = make_url("PROD")
+# Named environments, each configured by <NAME>_DB_* variables. Pool
+# settings fall back from <NAME>_DB_POOL_SIZE to DB_POOL_SIZE to the default.
+DB_ENVIRONMENTS = [name.strip() for name in os.getenv("DB_ENVIRONMENTS", "dev,prod").split(",") if name.strip()]
 
-dev_engine = create_engine(DEV_DB_URL)
-prod_engine = create_engine(PROD_DB_URL)
+def _setting(env: str, key: str, default: str) -> str:
+    return os.getenv(f"{env.upper()}_DB_{key}", os.getenv(f"DB_{key}", default))
 
-DevSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=dev_engine)
-ProdSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=prod_engine) 
\ No newline at end of file
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that counts checkouts which had to wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        if self.checkedin() > 0 or self._max_overflow < 0 or self.overflow() < self._max_overflow:
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            with self._stats_lock:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - started
+
+class Environment:
+    """One database environment; its engine is only created on first use"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.url = make_url(name.upper())
+        self.pool_size = int(_setting(name, "POOL_SIZE", "5"))
+        self.max_overflow = int(_setting(name, "MAX_OVERFLOW", "10"))
+        self.pool_timeout = float(_setting(name, "POOL_TIMEOUT", "30"))
+        self.pool_recycle = int(_setting(name, "POOL_RECYCLE", "1800"))
+        self.pool_pre_ping = _setting(name, "POOL_PRE_PING", "true").lower() == "true"
+        self._engine = None
+        self._session_factory = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._engine is not None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    engine = create_engine(
+                        self.url,
+                        poolclass=InstrumentedQueuePool,
+                        pool_size=self.pool_size,
+                        max_overflow=self.max_overflow,
+                        pool_timeout=self.pool_timeout,
+                        pool_recycle=self.pool_recycle,
+                        pool_pre_ping=self.pool_pre_ping,
+                    )
+                    for hook in _engine_hooks:
+                        hook(engine, self.name)
+                    self._engine = engine
+        return self._engine
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            # Sessions carry their environment name for code that gets handed one.
+            self._session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine, info={"env": self.name})
+        return self._session_factory
+
+    def pool_stats(self):
+        stats = {"env": self.name, "initialized": self.initialized, "pool_size": self.pool_size, "max_overflow": self.max_overflow}
+        if self.initialized:
+            pool = self._engine.pool
+            stats.update({
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "waits": pool.waits,
+                "wait_seconds": round(pool.wait_seconds, 4),
+                "timeouts": pool.timeouts,
+            })
+        return stats
+
+ENVIRONMENTS = {name: Environment(name) for name in DB_ENVIRONMENTS}
+_engine_hooks = []
+
+def on_engine_created(hook):
+    """Call hook(engine, env_name) for every engine, including ones that already exist"""
+    _engine_hooks.append(hook)
+    for environment in ENVIRONMENTS.values():
+        if environment.initialized:
+            hook(environment.engine, environment.name)
+
+def get_engine(env: str):
+    return ENVIRONMENTS[env].engine
+
+def session_factory(env: str):
+    return ENVIRONMENTS[env].session_factory
+
+def pool_stats():
+    return [environment.pool_stats() for environment in ENVIRONMENTS.values()]
+
+def dispose_all():
+    for environment in ENVIRONMENTS.values():
+        if environment.initialized:
+            environment.engine.dispose()
+
+# The names modules used before the registry, resolved lazily on access.
+_LEGACY_NAMES = {
+    "dev_engine": ("dev", "engine"),
+    "prod_engine": ("prod", "engine"),
+    "DevSessionLocal": ("dev", "session_factory"),
+    "ProdSessionLocal": ("prod", "session_factory"),
+    "DEV_DB_URL": ("dev", "url"),
+    "PROD_DB_URL": ("prod", "url"),
+}
+
+def __getattr__(name):
+    if name in _LEGACY_NAMES:
+        env, attribute = _LEGACY_NAMES[name]
+        return getattr(ENVIRONMENTS[env], attribute)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Dedicated threads for blocking database calls made from async endpoints, so
+# dev and prod reads can run side by side without tying up the event loop or
+# the threadpool FastAPI uses for sync handlers and dependencies.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "16"))
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+async def run_in_db_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, functools.partial(context.run, func, *args))
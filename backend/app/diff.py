@@ -0,0 +1,55 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Dict, Any, List, Optional
+from . import crud
+
+DIFF_MODES = ("hash", "date_updated")
+
+def row_fingerprints(db: Session, model, mode: str = "hash", ids: Optional[List[int]] = None) -> Dict[int, Any]:
+    """Map primary key to a per-row fingerprint computed inside the database.
+
+    The hash is taken over to_jsonb(row) so JSON columns compare by content
+    rather than by how the document text happened to be formatted.
+    """
+    table = model.__table__
+    pk = crud.primary_key_column(model).name
+    if mode == "date_updated":
+        value = 't."date_updated"'
+    else:
+        value = "md5(to_jsonb(t)::text)"
+    sql = f'SELECT t."{pk}", {value} FROM {table.schema}."{table.name}" t'
+    params = {}
+    if ids is not None:
+        sql += f' WHERE t."{pk}" = ANY(:ids)'
+        params["ids"] = list(ids)
+    return {row[0]: row[1] for row in db.execute(text(sql), params)}
+
+def field_deltas(model, dev_db: Session, prod_db: Session, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    pk = crud.primary_key_column(model).name
+    dev_env, prod_env = dev_db.info.get("env", "dev"), prod_db.info.get("env", "prod")
+    dev_rows = {row[pk]: row for row in crud.get_rows_for_sync(dev_db, model, ids)}
+    prod_rows = {row[pk]: row for row in crud.get_rows_for_sync(prod_db, model, ids)}
+    deltas = {}
+    for i in ids:
+        dev_row, prod_row = dev_rows.get(i, {}), prod_rows.get(i, {})
+        deltas[i] = {
+            field: {dev_env: dev_row.get(field), prod_env: prod_row.get(field)}
+            for field in model.__table__.columns.keys()
+            if dev_row.get(field) != prod_row.get(field)
+        }
+    return deltas
+
+def compare_fingerprints(dev: Dict[int, Any], prod: Dict[int, Any]) -> Dict[str, Any]:
+    changed = sorted(i for i in dev.keys() & prod.keys() if dev[i] != prod[i])
+    return {
+        "added": sorted(dev.keys() - prod.keys()),
+        "removed": sorted(prod.keys() - dev.keys()),
+        "changed": changed,
+        "unchanged": len(dev.keys() & prod.keys()) - len(changed),
+    }
+
+def diff_entity(model, dev_db: Session, prod_db: Session, mode: str = "hash", include_deltas: bool = False, delta_limit: int = 100) -> Dict[str, Any]:
+    result = {"mode": mode, **compare_fingerprints(row_fingerprints(dev_db, model, mode), row_fingerprints(prod_db, model, mode))}
+    if include_deltas:
+        result["deltas"] = field_deltas(model, dev_db, prod_db, result["changed"][:delta_limit])
+    return result
@@ -0,0 +1,113 @@
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from . import crud, encoding, models, read_cache
+
+# Every table a document is assembled from; a write to any of them drops it.
+DOCUMENT_TABLES = {
+    "catalog": (models.Catalog.__tablename__, models.CatalogMapping.__tablename__, models.CatalogSample.__tablename__),
+    "context": (models.Context.__tablename__, models.Catalog.__tablename__),
+}
+
+def _columns(row, model) -> Dict[str, Any]:
+    return {c.key: getattr(row, c.key) for c in model.__table__.columns}
+
+def catalog_document(catalog: models.Catalog) -> Dict[str, Any]:
+    document = _columns(catalog, models.Catalog)
+    document["mapping"] = [
+        {"roleid": m.roleid, "categoryid": m.categoryid, "systemid": m.systemid} for m in catalog.mappings
+    ]
+    document["rules_list"] = catalog.rules or []
+    document["samples"] = (catalog.sample.samples if catalog.sample else None) or []
+    return document
+
+def _relevant_table_names(relevanttables) -> list:
+    names = []
+    for entry in relevanttables or []:
+        name = entry.get("table_name") if isinstance(entry, dict) else entry
+        if isinstance(name, str):
+            names.append(name)
+    return names
+
+def context_document(db, context: models.Context) -> Dict[str, Any]:
+    document = _columns(context, models.Context)
+    document["tables"] = [
+        {"tableid": c.tableid, "table_vector_id": c.table_vector_id, "table_name": c.table_name, "table_description": c.table_description}
+        for c in crud.get_catalogs_by_table_names(db, _relevant_table_names(context.relevanttables))
+    ]
+    return document
+
+def render(document: Dict[str, Any]) -> Tuple[str, bytes]:
+    body = encoding.dumps(document)
+    return f'"{hashlib.sha1(body).hexdigest()}"', body
+
+def _cached(entity: str, env: str, record_id: int, build: Callable[[], Optional[Dict[str, Any]]]):
+    """(etag, body) of a rendered document through the read cache"""
+    def load():
+        document = build()
+        return render(document) if document is not None else None
+    return read_cache.cached(env, DOCUMENT_TABLES[entity], ("document", entity, record_id), load)
+
+def _record_id(entity: str, env: str, vector_id: str, load: Callable[[], Optional[int]]) -> Optional[int]:
+    return read_cache.cached(env, DOCUMENT_TABLES[entity][:1], ("vector", entity, vector_id), load)
+
+def full_catalog(db, env: str, tableid: Optional[int] = None, table_vector_id: Optional[str] = None):
+    """(etag, body) of an assembled catalog document, or None when it does not exist"""
+    loaded = {}
+    if tableid is None:
+        # A cold vector id lookup loads the whole catalog, which then builds the document.
+        def lookup():
+            loaded["catalog"] = crud.get_full_catalog(db, table_vector_id=table_vector_id)
+            return loaded["catalog"].tableid if loaded["catalog"] else None
+        tableid = _record_id("catalog", env, table_vector_id, lookup)
+        if tableid is None:
+            return None
+    return _cached("catalog", env, tableid, lambda: catalog_document(loaded["catalog"]) if loaded else _build_catalog(db, tableid=tableid))
+
+def _build_catalog(db, tableid: int):
+    catalog = crud.get_full_catalog(db, tableid=tableid)
+    return catalog_document(catalog) if catalog else None
+
+def full_context(db, env: str, contextid: Optional[int] = None, context_vector_id: Optional[str] = None):
+    loaded = {}
+    if contextid is None:
+        def lookup():
+            loaded["context"] = crud.get_context_by_vector_id(db, context_vector_id)
+            return loaded["context"].contextid if loaded["context"] else None
+        contextid = _record_id("context", env, context_vector_id, lookup)
+        if contextid is None:
+            return None
+    return _cached("context", env, contextid, lambda: context_document(db, loaded["context"]) if loaded else _build_context(db, contextid))
+
+def _build_context(db, contextid: int):
+    context = crud.get_context_by_id(db, contextid)
+    return context_document(db, context) if context else None
+
+def invalidate(entity: str, env: Optional[str] = None, record_ids: Optional[Iterable[int]] = None) -> int:
+    """Drop cached documents; vector lookups for the entity go too, as a synced row may carry a new vector id.
+
+    Commits through a session already invalidate the tables they wrote; this
+    is for callers that know exactly which records changed.
+    """
+    ids = set(record_ids) if record_ids is not None else None
+    return read_cache.invalidate_where(
+        env, lambda key: key[2] in ("document", "vector") and key[3] == entity and (key[2] == "vector" or ids is None or key[4] in ids)
+    )
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def create_tables(engine) -> List[str]:
+    """Create the tables and vector id indexes documents read from on an existing database, skipping any that exist"""
+    created = []
+    for model in (models.CatalogMapping, models.CatalogSample):
+        model.__table__.create(engine, checkfirst=True)
+        created.append(model.__tablename__)
+    for column in (models.Catalog.table_vector_id, models.Context.context_vector_id):
+        for index in column.table.indexes:
+            if list(index.columns) == [column]:
+                index.create(engine, checkfirst=True)
+                created.append(index.name)
+    return created
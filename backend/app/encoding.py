@@ -0,0 +1,21 @@
+import json
+from datetime import date, datetime
+from typing import Any
+from . import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{value.__class__.__name__} is not JSON serializable")
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON bytes; datetimes are ISO 8601 as in the pydantic schemas"""
+    with metrics.track("serialization"):
+        if orjson is not None:
+            return orjson.dumps(value, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(value, default=json_default, separators=(",", ":")).encode()
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional, Set
+from . import crud, encoding
+
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "10000"))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "1000"))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+EVENT_RETRY_MS = 3000
+
+ENTITY_NAMES = {model: name for name, model in crud.ENTITY_MODELS.items()}
+
+class Subscriber:
+    def __init__(self, entities: Optional[Set[str]], envs: Optional[Set[str]]):
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.entities = entities
+        self.envs = envs
+        # Set when the queue filled up; the stream then tells the client to resync.
+        self.overflowed = False
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        return (self.entities is None or event["entity"] in self.entities) and (self.envs is None or event["env"] in self.envs)
+
+class EventBroker:
+    """In-process fan-out of change events to SSE subscribers, with a replay buffer for Last-Event-ID"""
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self._buffer: "deque[Dict[str, Any]]" = deque(maxlen=buffer_size)
+        self._subscribers: Set[Subscriber] = set()
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def publish(self, entity: str, record_id: int, env: str, action: str, version: Optional[datetime] = None):
+        """Record an event; safe to call from the threadpool that runs sync endpoints"""
+        with self._lock:
+            event = {
+                "id": self._next_id, "entity": entity, "record_id": record_id, "env": env, "action": action,
+                "version": version.isoformat() if version is not None else None, "ts": time.time(),
+            }
+            self._next_id += 1
+            self._buffer.append(event)
+        if self._loop is not None and self._subscribers:
+            self._loop.call_soon_threadsafe(self._fan_out, event)
+
+    def _fan_out(self, event: Dict[str, Any]):
+        for subscriber in list(self._subscribers):
+            if not subscriber.wants(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A slow client must not hold events back from the others.
+                subscriber.overflowed = True
+                self._subscribers.discard(subscriber)
+
+    def subscribe(self, entities: Optional[Set[str]] = None, envs: Optional[Set[str]] = None, last_event_id: Optional[int] = None):
+        """(subscriber, backlog); backlog is None when last_event_id is older than the buffer"""
+        subscriber = Subscriber(entities, envs)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if last_event_id is None:
+                return subscriber, []
+            # Ids restart with the process, so an id from the future also means events were lost.
+            if last_event_id >= self._next_id or (self._buffer and self._buffer[0]["id"] > last_event_id + 1):
+                return subscriber, None
+            return subscriber, [e for e in self._buffer if e["id"] > last_event_id and subscriber.wants(e)]
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "buffered": len(self._buffer), "last_event_id": self._next_id - 1}
+
+broker = EventBroker()
+
+def publish_rows(model, env: str, action: str, rows: Iterable[Dict[str, Any]]):
+    """One event per row, versioned by the row's date_updated"""
+    entity = ENTITY_NAMES[model]
+    pk = crud.primary_key_column(model).name
+    for row in rows:
+        broker.publish(entity, row[pk], env, action, row.get("date_updated"))
+
+def publish_synced(model, env: str, results: List[Dict[str, Any]]):
+    """Events for the rows crud.sync_batch_to_prod wrote"""
+    entity = ENTITY_NAMES[model]
+    for result in results:
+        if result["status"] != "not_found":
+            broker.publish(entity, result["id"], env, "synced", result["version"])
+
+def publish_record(record, env: str, action: str):
+    model = type(record)
+    publish_rows(model, env, action, [{c.name: getattr(record, c.key) for c in model.__table__.columns}])
+
+def format_event(event: Dict[str, Any]) -> bytes:
+    data = {k: v for k, v in event.items() if k != "id"}
+    return b"id: %d\nevent: change\ndata: %s\n\n" % (event["id"], encoding.dumps(data))
+
+async def stream(subscriber: Subscriber, backlog: Optional[List[Dict[str, Any]]]):
+    """SSE body: replayed backlog, then live events and heartbeat comments"""
+    try:
+        yield b"retry: %d\n\n" % EVENT_RETRY_MS
+        if backlog is None:
+            # Missed events fell out of the buffer; the client reloads its lists.
+            yield b"event: resync\ndata: {}\n\n"
+            backlog = []
+        last_sent = 0
+        for event in backlog:
+            last_sent = event["id"]
+            yield format_event(event)
+        while True:
+            if subscriber.overflowed and subscriber.queue.empty():
+                yield b"event: resync\ndata: {}\n\n"
+                return
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), EVENT_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": heartbeat\n\n"
+                continue
+            # Events published while subscribing can be both replayed and queued.
+            if event["id"] <= last_sent:
+                continue
+            last_sent = event["id"]
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscriber)
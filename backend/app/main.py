@@ -1,17 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException, Body
+from fastapi import FastAPI, Depends, HTTPException, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from . import db, crud, models, schemas
+from sqlalchemy.exc import SQLAlchemyError
+from . import db, crud, models, schemas, diff, promotion, sources, metadata_jobs, partitions, documents, encoding, metrics, replication, reconcile, search, profiling, events, read_cache
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional
-from datetime import datetime, timedelta
-import random
+from fastapi.middleware.gzip import GZipMiddleware
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import asyncio
+import hashlib
 import base64
 import json
 import os
 import requests
-from pydantic import BaseModel
 
-app = FastAPI()
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+app = FastAPI(default_response_class=metrics.TimedJSONResponse)
+if BrotliMiddleware is not None:
+    # Falls back to gzip for clients that do not accept br.
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
 app.add_middleware(
       CORSMiddleware,
       allow_origins=["*"],
@@ -19,167 +36,435 @@ app.add_middleware(
       allow_methods=["*"],
       allow_headers=["*"],
   )
-def get_dev_db():
-    db_session = db.DevSessionLocal()
+# Outermost, so request latency includes compression and byte counts are what went over the wire.
+app.add_middleware(metrics.MetricsMiddleware)
+db.on_engine_created(metrics.instrument_engine)
+
+def open_session(env: str, param: str = "env"):
+    if env not in db.ENVIRONMENTS:
+        raise HTTPException(status_code=400, detail=f"{param} must be one of {', '.join(db.ENVIRONMENTS)}")
+    db_session = db.session_factory(env)()
     try:
         yield db_session
     finally:
         db_session.close()
 
-def get_prod_db():
-    db_session = db.ProdSessionLocal()
+def get_dev_db():
+    yield from open_session("dev")
+
+def get_env_db(env: str = "dev"):
+    yield from open_session(env)
+
+# Compare and sync endpoints read from source and write to target; the
+# defaults keep the original dev -> prod behaviour.
+def get_source_db(source: str = "dev"):
+    yield from open_session(source, "source")
+
+def get_target_db(target: str = "prod"):
+    yield from open_session(target, "target")
+
+def env_pair(source_db: Session, target_db: Session):
+    source, target = source_db.info["env"], target_db.info["env"]
+    if source == target:
+        raise HTTPException(status_code=400, detail="source and target must be different environments")
+    return source, target
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+MAX_PAGE_SIZE = 1000
+
+def wants_ndjson(request: Request):
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def parse_fields(model, fields: Optional[str]):
+    """Validate a comma-separated fields= value; the primary key is always included"""
+    if not fields:
+        return None
+    pk = crud.primary_key_column(model).key
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in model.__table__.columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys([pk] + requested))
+
+def response_columns(model, schema, fields: Optional[List[str]]):
+    """Columns to select, in the order the schema serializes them"""
+    return fields or [name for name in schema.model_fields if name in model.__table__.columns]
+
+async def compare_page(model, columns: List[str], source_db: Session, target_db: Session, after: Optional[int], limit: Optional[int]):
+    """One keyset page of source and target rows covering the same primary-key window"""
+    pk = crud.primary_key_column(model).key
+    source_rows, target_rows = await asyncio.gather(
+        db.run_in_db_executor(crud.get_page_rows, source_db, model, columns, after, limit),
+        db.run_in_db_executor(crud.get_page_rows, target_db, model, columns, after, limit),
+    )
+    next_cursor = None
+    if limit is not None:
+        # A full page may stop short of the other environment's rows, so the
+        # window ends at the smaller last key of the pages that filled up.
+        full_pages = [rows[-1][pk] for rows in (source_rows, target_rows) if len(rows) == limit]
+        next_cursor = min(full_pages) if full_pages else None
+        if next_cursor is not None:
+            source_rows = [r for r in source_rows if r[pk] <= next_cursor]
+            target_rows = [r for r in target_rows if r[pk] <= next_cursor]
+    # Keyed by environment name: "dev" and "prod" unless other ones were asked for.
+    response = {source_db.info["env"]: source_rows, target_db.info["env"]: target_rows}
+    if limit is not None:
+        response["next_cursor"] = next_cursor
+    return response
+
+def stream_compare(model, columns: List[str], envs: List[str]):
+    """Stream every source then target row as NDJSON lines of {"env": ..., "row": ...}"""
+    def generate():
+        # Sessions are opened here rather than injected because dependency
+        # cleanup runs before a streaming body is sent.
+        for env in envs:
+            with db.session_factory(env)() as session:
+                for row in crud.stream_rows(session, model, columns):
+                    yield encoding.dumps({"env": env, "row": row}) + b"\n"
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
+
+async def list_compare(request: Request, model, schema, source_db: Session, target_db: Session, after: Optional[int], limit: Optional[int], fields: Optional[str] = None):
+    envs = env_pair(source_db, target_db)
+    selected = parse_fields(model, fields)
+    columns = response_columns(model, schema, selected)
+    if wants_ndjson(request):
+        return stream_compare(model, columns, list(envs))
+    source_stamp, target_stamp = await asyncio.gather(
+        db.run_in_db_executor(crud.get_version_stamp, source_db, model),
+        db.run_in_db_executor(crud.get_version_stamp, target_db, model),
+    )
+    etag = 'W/"' + hashlib.sha1(repr((model.__tablename__, envs, source_stamp, target_stamp, after, limit, selected)).encode()).hexdigest() + '"'
+    # Only the ETag decides 304s: a deleted row lowers the count but may not
+    # move max(date_updated), so If-Modified-Since alone could serve stale data.
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    modified = [stamp[0] for stamp in (source_stamp, target_stamp) if stamp[0] is not None]
+    if modified:
+        headers["Last-Modified"] = format_datetime(max(modified).replace(tzinfo=timezone.utc), usegmt=True)
+    if documents.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    # Rows come back as plain mappings from Core selects and are encoded in
+    # one pass, skipping per-row ORM instances and schema validation.
+    page = await compare_page(model, columns, source_db, target_db, after, limit)
+    return Response(content=await run_in_threadpool(encoding.dumps, page), media_type="application/json", headers=headers)
+
+async def get_detail(model, schema, source_db: Session, target_db: Session, record_id: int):
+    """Full row, heavy JSON columns included, from both environments"""
+    def read(session):
+        def load():
+            row = session.get(model, record_id)
+            return schema.from_orm(row).model_dump() if row else None
+        return read_cache.cached(session.info["env"], (model.__tablename__,), ("detail", record_id), load)
+    source, target = env_pair(source_db, target_db)
+    source_row, target_row = await asyncio.gather(db.run_in_db_executor(read, source_db), db.run_in_db_executor(read, target_db))
+    if source_row is None and target_row is None:
+        raise HTTPException(status_code=404, detail=f"{model.__name__} not found")
+    return {source: source_row, target: target_row}
+
+def sync_batch(model, request_body: schemas.SyncBatchRequest, source_db: Session, target_db: Session):
+    _, target = env_pair(source_db, target_db)
+    if request_body.ids is None and request_body.updated_since is None and not request_body.all:
+        raise HTTPException(status_code=400, detail="Provide ids, updated_since or all=true")
     try:
-        yield db_session
-    finally:
-        db_session.close()
+        results = crud.sync_batch_to_prod(model, source_db, target_db, request_body.ids, request_body.updated_since)
+    except SQLAlchemyError as exc:
+        raise HTTPException(status_code=500, detail=f"Batch sync rolled back: {exc.__class__.__name__}")
+    documents.invalidate(model.__tablename__, target, [r["id"] for r in results if r["status"] != "not_found"])
+    events.publish_synced(model, target, results)
+    return {"status": "success", "results": results}
+
+@app.on_event("startup")
+async def bind_event_broker():
+    events.broker.bind(asyncio.get_running_loop())
+
+def parse_names(value: Optional[str], allowed, param: str):
+    if not value:
+        return None
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown {param}: {', '.join(sorted(unknown))}")
+    return names
+
+@app.get("/events")
+async def stream_events(request: Request, entities: Optional[str] = None, env: Optional[str] = None, last_event_id: Optional[int] = None):
+    """Server-sent change events ({entity, record_id, env, action, version}) for clients to patch local state"""
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    subscriber, backlog = events.broker.subscribe(
+        parse_names(entities, crud.ENTITY_MODELS, "entities"), parse_names(env, db.ENVIRONMENTS, "env"), last_event_id,
+    )
+    # The explicit Content-Encoding keeps the compression middleware from buffering the stream.
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"}
+    return StreamingResponse(events.stream(subscriber, backlog), media_type="text/event-stream", headers=headers)
+
+@app.get("/events/stats")
+def get_event_stats():
+    return events.broker.stats()
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Request, SQL and serialization metrics in the Prometheus text format"""
+    stats = read_cache.cache.stats()
+    for name, key in (("autobi_cache_evictions_total", "evictions"), ("autobi_cache_invalidations_total", "invalidations"), ("autobi_cache_bytes", "bytes"), ("autobi_cache_entries", "entries")):
+        metrics.set_value(name, stats[key])
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/systems/")
-def list_systems(dev_db: Session = Depends(get_dev_db), prod_db: Session = Depends(get_prod_db)):
-    dev_systems = crud.get_all_systems(dev_db)
-    prod_systems = crud.get_all_systems(prod_db)
-    return {"dev": [schemas.System.from_orm(s) for s in dev_systems], "prod": [schemas.System.from_orm(s) for s in prod_systems]}
+async def list_systems(request: Request, after: Optional[int] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return await list_compare(request, models.System, schemas.System, source_db, target_db, after, limit, fields)
 
 @app.post("/systems/sync/{systemid}")
-def sync_system(systemid: int, dev_db: Session = Depends(get_dev_db), prod_db: Session = Depends(get_prod_db)):
-    dev_system = crud.get_system_by_id(dev_db, systemid)
-    if not dev_system:
-        raise HTTPException(status_code=404, detail="System not found in dev")
-    crud.upsert_system_to_prod(dev_system, prod_db)
+def sync_system(systemid: int, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    source, target = env_pair(source_db, target_db)
+    source_system = crud.get_system_by_id(source_db, systemid)
+    if not source_system:
+        raise HTTPException(status_code=404, detail=f"System not found in {source}")
+    crud.upsert_system_to_prod(source_system, target_db)
+    events.publish_record(source_system, target, "synced")
     return {"status": "success"}
 
+@app.post("/systems/sync", response_model=schemas.SyncBatchResponse)
+def sync_systems_batch(request_body: schemas.SyncBatchRequest, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return sync_batch(models.System, request_body, source_db, target_db)
+
 @app.get("/roles/")
-def list_roles(dev_db: Session = Depends(get_dev_db), prod_db: Session = Depends(get_prod_db)):
-    dev_roles = crud.get_all_roles(dev_db)
-    prod_roles = crud.get_all_roles(prod_db)
-    return {"dev": [schemas.Role.from_orm(r) for r in dev_roles], "prod": [schemas.Role.from_orm(r) for r in prod_roles]}
+async def list_roles(request: Request, after: Optional[int] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return await list_compare(request, models.Role, schemas.Role, source_db, target_db, after, limit, fields)
 
 @app.post("/roles/sync/{roleid}")
-def sync_role(roleid: int, dev_db: Session = Depends(get_dev_db), prod_db: Session = Depends(get_prod_db)):
-    dev_role = crud.get_role_by_id(dev_db, roleid)
-    if not dev_role:
-        raise HTTPException(status_code=404, detail="Role not found in dev")
-    crud.upsert_role_to_prod(dev_role, prod_db)
+def sync_role(roleid: int, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    source, target = env_pair(source_db, target_db)
+    source_role = crud.get_role_by_id(source_db, roleid)
+    if not source_role:
+        raise HTTPException(status_code=404, detail=f"Role not found in {source}")
+    crud.upsert_role_to_prod(source_role, target_db)
+    events.publish_record(source_role, target, "synced")
     return {"status": "success"}
 
+@app.post("/roles/sync", response_model=schemas.SyncBatchResponse)
+def sync_roles_batch(request_body: schemas.SyncBatchRequest, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return sync_batch(models.Role, request_body, source_db, target_db)
+
 @app.get("/categories/")
-def list_categories(dev_db: Session = Depends(get_dev_db), prod_db: Session = Depends(get_prod_db)):
-    dev_categories = crud.get_all_categories(dev_db)
-    prod_categories = crud.get_all_categories(prod_db)
-    return {"dev": [schemas.Category.from_orm(c) for c in dev_categories], "prod": [schemas.Category.from_orm(c) for c in prod_categories]}
+async def list_categories(request: Request, after: Optional[int] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return await list_compare(request, models.Category, schemas.Category, source_db, target_db, after, limit, fields)
 
 @app.post("/categories/sync/{categoryid}")
-def sync_category(categoryid: int, dev_db: Session = Depends(get_dev_db), prod_db: Session = Depends(get_prod_db)):
-    dev_category = crud.get_category_by_id(dev_db, categoryid)
-    if not dev_category:
-        raise HTTPException(status_code=404, detail="Category not found in dev")
-    crud.upsert_category_to_prod(dev_category, prod_db)
+def sync_category(categoryid: int, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    source, target = env_pair(source_db, target_db)
+    source_category = crud.get_category_by_id(source_db, categoryid)
+    if not source_category:
+        raise HTTPException(status_code=404, detail=f"Category not found in {source}")
+    crud.upsert_category_to_prod(source_category, target_db)
+    events.publish_record(source_category, target, "synced")
     return {"status": "success"}
 
+@app.post("/categories/sync", response_model=schemas.SyncBatchResponse)
+def sync_categories_batch(request_body: schemas.SyncBatchRequest, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return sync_batch(models.Category, request_body, source_db, target_db)
+
+async def search_response(table_name: str, q: str, limit: int, env: str, db_session: Session):
+    results = await db.run_in_db_executor(search.search, db_session, table_name, q, limit)
+    return {"query": q, "env": env, "results": results}
+
+# Declared before /catalogs/{tableid} and /contexts/{contextid} so "search"
+# is not taken for an id.
+@app.get("/catalogs/search")
+async def search_catalogs(q: str = Query(..., min_length=1), limit: int = Query(search.SEARCH_DEFAULT_LIMIT, ge=1, le=search.SEARCH_MAX_LIMIT), env: str = "dev", db: Session = Depends(get_env_db)):
+    """Catalogs ranked by how well their names, column names and description match q"""
+    return await search_response(models.Catalog.__tablename__, q, limit, env, db)
+
+@app.get("/contexts/search")
+async def search_contexts(q: str = Query(..., min_length=1), limit: int = Query(search.SEARCH_DEFAULT_LIMIT, ge=1, le=search.SEARCH_MAX_LIMIT), env: str = "dev", db: Session = Depends(get_env_db)):
+    """Contexts ranked by how well their names, tables, column names and description match q"""
+    return await search_response(models.Context.__tablename__, q, limit, env, db)
+
 @app.get("/catalogs/")
-def list_catalogs(dev_db: Session = Depends(get_dev_db), prod_db: Session = Depends(get_prod_db)):
-    dev_catalogs = crud.get_all_catalogs(dev_db)
-    prod_catalogs = crud.get_all_catalogs(prod_db)
-    return {"dev": [schemas.Catalog.from_orm(c) for c in dev_catalogs], "prod": [schemas.Catalog.from_orm(c) for c in prod_catalogs]}
+async def list_catalogs(request: Request, after: Optional[int] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return await list_compare(request, models.Catalog, schemas.Catalog, source_db, target_db, after, limit, fields)
 
 @app.post("/catalogs/sync/{tableid}")
-def sync_catalog(tableid: int, dev_db: Session = Depends(get_dev_db), prod_db: Session = Depends(get_prod_db)):
-    dev_catalog = crud.get_catalog_by_id(dev_db, tableid)
-    if not dev_catalog:
-        raise HTTPException(status_code=404, detail="Catalog not found in dev")
-    crud.upsert_catalog_to_prod(dev_catalog, prod_db)
+def sync_catalog(tableid: int, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    source, target = env_pair(source_db, target_db)
+    source_catalog = crud.get_catalog_by_id(source_db, tableid)
+    if not source_catalog:
+        raise HTTPException(status_code=404, detail=f"Catalog not found in {source}")
+    crud.upsert_catalog_to_prod(source_catalog, target_db)
+    documents.invalidate(models.Catalog.__tablename__, target, [tableid])
+    events.publish_record(source_catalog, target, "synced")
     return {"status": "success"}
 
+@app.post("/catalogs/sync", response_model=schemas.SyncBatchResponse)
+def sync_catalogs_batch(request_body: schemas.SyncBatchRequest, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return sync_batch(models.Catalog, request_body, source_db, target_db)
+
+@app.get("/catalogs/{tableid}")
+async def get_catalog(tableid: int, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return await get_detail(models.Catalog, schemas.Catalog, source_db, target_db, tableid)
+
 @app.get("/contexts/")
-def list_contexts(dev_db: Session = Depends(get_dev_db), prod_db: Session = Depends(get_prod_db)):
-    dev_contexts = crud.get_all_contexts(dev_db)
-    prod_contexts = crud.get_all_contexts(prod_db)
-    return {"dev": [schemas.Context.from_orm(c) for c in dev_contexts], "prod": [schemas.Context.from_orm(c) for c in prod_contexts]}
+async def list_contexts(request: Request, after: Optional[int] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return await list_compare(request, models.Context, schemas.Context, source_db, target_db, after, limit, fields)
 
 @app.post("/contexts/sync/{contextid}")
-def sync_context(contextid: int, dev_db: Session = Depends(get_dev_db), prod_db: Session = Depends(get_prod_db)):
-    dev_context = crud.get_context_by_id(dev_db, contextid)
-    if not dev_context:
-        raise HTTPException(status_code=404, detail="Context not found in dev")
-    crud.upsert_context_to_prod(dev_context, prod_db)
+def sync_context(contextid: int, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    source, target = env_pair(source_db, target_db)
+    source_context = crud.get_context_by_id(source_db, contextid)
+    if not source_context:
+        raise HTTPException(status_code=404, detail=f"Context not found in {source}")
+    crud.upsert_context_to_prod(source_context, target_db)
+    documents.invalidate(models.Context.__tablename__, target, [contextid])
+    events.publish_record(source_context, target, "synced")
     return {"status": "success"}
 
+@app.post("/contexts/sync", response_model=schemas.SyncBatchResponse)
+def sync_contexts_batch(request_body: schemas.SyncBatchRequest, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return sync_batch(models.Context, request_body, source_db, target_db)
+
+@app.get("/contexts/{contextid}")
+async def get_context(contextid: int, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    return await get_detail(models.Context, schemas.Context, source_db, target_db, contextid)
+
+@app.get("/diff/{entity}")
+async def diff_entity(entity: str, mode: str = "hash", deltas: bool = False, delta_limit: int = 100, source_db: Session = Depends(get_source_db), target_db: Session = Depends(get_target_db)):
+    """Compare source and target by primary key and return only the ids that differ"""
+    source, target = env_pair(source_db, target_db)
+    model = crud.ENTITY_MODELS.get(entity)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Unknown entity: {entity}")
+    if mode not in diff.DIFF_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(diff.DIFF_MODES)}")
+    source_fingerprints, target_fingerprints = await asyncio.gather(
+        db.run_in_db_executor(diff.row_fingerprints, source_db, model, mode),
+        db.run_in_db_executor(diff.row_fingerprints, target_db, model, mode),
+    )
+    result = {"entity": entity, "source": source, "target": target, "mode": mode, **diff.compare_fingerprints(source_fingerprints, target_fingerprints)}
+    if deltas:
+        result["deltas"] = await db.run_in_db_executor(diff.field_deltas, model, source_db, target_db, result["changed"][:delta_limit])
+    return result
+
+@app.get("/reconcile/{entity}")
+async def reconcile_entity(
+    entity: str,
+    fanout: int = Query(reconcile.RECONCILE_FANOUT, ge=2, le=256),
+    leaf_rows: int = Query(reconcile.RECONCILE_LEAF_ROWS, ge=1, le=10000),
+    max_diffs: int = Query(reconcile.RECONCILE_MAX_DIFFS, ge=1),
+    source_db: Session = Depends(get_source_db),
+    target_db: Session = Depends(get_target_db),
+):
+    """Locate drift between source and target by narrowing in on buckets whose checksums differ"""
+    source, target = env_pair(source_db, target_db)
+    model = reconcile.RECONCILE_MODELS.get(entity)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Unknown entity: {entity}")
+    try:
+        result = await reconcile.reconcile(model, source_db, target_db, fanout, leaf_rows, max_diffs)
+    except SQLAlchemyError as exc:
+        raise HTTPException(status_code=500, detail=f"Reconciliation failed: {exc.__class__.__name__}")
+    return {"entity": entity, "source": source, "target": target, **result}
+
+@app.post("/promote")
+def promote(request_body: schemas.PromotionRequest):
+    """Promote dev to prod across all entities in foreign-key order (dry run by default)"""
+    unknown = [e for e in request_body.entities or [] if e not in crud.ENTITY_MODELS]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown entities: {', '.join(unknown)}")
+    return promotion.promote(request_body.entities, request_body.dry_run)
+
+@app.post("/replicate")
+def replicate(request_body: schemas.ReplicationRequest):
+    """Replay dev changes recorded in the audit trail into prod, deletes included"""
+    unknown = [e for e in request_body.entities or [] if e not in crud.ENTITY_MODELS]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown entities: {', '.join(unknown)}")
+    return replication.replicate(request_body.entities, request_body.batch_size, request_body.max_batches)
+
+@app.get("/replicate/status")
+def get_replication_status():
+    return replication.replication_status()
+
 @app.get("/audit/history/{table_name}/{record_id}", response_model=List[schemas.TableAudit])
-def get_record_history(table_name: str, record_id: int, db: Session = Depends(get_dev_db)):
+def get_record_history(table_name: str, record_id: int, limit: Optional[int] = Query(None, ge=1), db: Session = Depends(get_dev_db)):
     """Get audit history for a specific record in a table"""
-    history = db.query(models.TableAudit).filter(
-        models.TableAudit.table_name == table_name,
-        models.TableAudit.record_id == record_id
-    ).order_by(models.TableAudit.changed_at.desc()).all()
-    
+    history = crud.get_record_history(db, table_name, record_id, limit)
     if not history:
         raise HTTPException(status_code=404, detail="No history found for this record")
     return history
 
+@app.post("/audit/history/{table_name}/latest", response_model=Dict[int, List[schemas.TableAudit]])
+def get_latest_history(table_name: str, request_body: schemas.LatestHistoryRequest, db: Session = Depends(get_dev_db)):
+    """Get the latest entries for many records of a table in one query"""
+    return crud.get_latest_history(db, table_name, request_body.record_ids, request_body.limit)
+
+@app.get("/audit/state/{table_name}/{record_id}/{audit_id}")
+def get_record_state(table_name: str, record_id: int, audit_id: int, db: Session = Depends(get_dev_db)):
+    """Rebuild the full state of a record as of an audit entry"""
+    if table_name not in models.AUDITED_MODELS:
+        raise HTTPException(status_code=404, detail=f"Table {table_name} is not audited")
+    state = crud.get_record_state(db, table_name, record_id, audit_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Record did not exist at this audit point")
+    return {"table_name": table_name, "record_id": record_id, "audit_id": audit_id, "state": state}
+
+def encode_audit_cursor(entry: models.TableAudit) -> str:
+    return base64.urlsafe_b64encode(f"{entry.changed_at.isoformat()}|{entry.audit_id}".encode()).decode()
+
+def decode_audit_cursor(cursor: str):
+    try:
+        changed_at, audit_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(changed_at), int(audit_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/audit/table/{table_name}", response_model=List[schemas.TableAudit])
 def get_table_history(
     table_name: str,
+    response: Response,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(crud.AUDIT_PAGE_SIZE, ge=1, le=1000),
     db: Session = Depends(get_dev_db)
 ):
-    """Get audit history for an entire table with optional date filtering"""
-    query = db.query(models.TableAudit).filter(
-        models.TableAudit.table_name == table_name
-    )
-    
-    if start_date:
-        query = query.filter(models.TableAudit.changed_at >= start_date)
-    if end_date:
-        query = query.filter(models.TableAudit.changed_at <= end_date)
-        
-    history = query.order_by(models.TableAudit.changed_at.desc()).all()
-    
-    if not history:
+    """Get audit history for an entire table with optional date filtering.
+
+    Results are paged newest first; pass the X-Next-Cursor header of one page
+    as cursor to fetch the next.
+    """
+    before = decode_audit_cursor(cursor) if cursor else None
+    history = crud.get_table_history_page(db, table_name, start_date, end_date, before, limit)
+    if not history and not cursor:
         raise HTTPException(status_code=404, detail="No history found for this table")
+    if len(history) == limit:
+        response.headers["X-Next-Cursor"] = encode_audit_cursor(history[-1])
     return history
 
-@app.get("/catalogs/{tableid}/history", response_model=List[schemas.TableAudit])
-def get_catalog_history(tableid: int):
-    actions = ["INSERT", "UPDATE", "DELETE"]
-    history = []
-    for i in range(20):
-        history.append(schemas.TableAudit(
-            audit_id=i+1,
-            table_name="catalog",
-            record_id=tableid,
-            action=random.choice(actions),
-            old_data={"table_name": f"Catalog {tableid}", "desc": "Old description"},
-            new_data={"table_name": f"Catalog {tableid}", "desc": f"New description {i}"},
-            changed_by=f"user{i%3}",
-            changed_at=f"2024-06-0{(i%9)+1}T12:00:00",
-            change_reason="Mocked change"
-        ))
-    return history
+@app.get("/audit/partitions")
+def list_audit_partitions():
+    with db.dev_engine.connect() as conn:
+        return partitions.list_partitions(conn)
 
-@app.get("/catalogs/full/{tableid}")
-def get_full_catalog(tableid: int, dev_db: Session = Depends(get_dev_db)):
-    catalog = crud.get_full_catalog_by_id(dev_db, tableid)
-    if not catalog:
-        raise HTTPException(status_code=404, detail="Catalog not found")
-    return catalog
+@app.post("/audit/partitions/maintain")
+def maintain_audit_partitions(keep_months: int = Query(partitions.AUDIT_RETENTION_MONTHS, ge=1), mode: str = partitions.AUDIT_RETENTION_MODE):
+    """Create upcoming monthly partitions and compact or detach expired ones"""
+    if mode not in partitions.RETENTION_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(partitions.RETENTION_MODES)}")
+    return partitions.maintain(db.dev_engine, keep_months=keep_months, mode=mode)
+
+@app.on_event("startup")
+def create_upcoming_audit_partitions():
+    if os.getenv("AUDIT_PARTITION_MAINTENANCE", "false").lower() == "true":
+        with db.dev_engine.begin() as conn:
+            partitions.ensure_partitions(conn)
+
+@app.get("/catalogs/{tableid}/history", response_model=List[schemas.TableAudit])
+def get_catalog_history(tableid: int, limit: int = Query(50, ge=1, le=1000), db: Session = Depends(get_dev_db)):
+    return crud.get_record_history(db, models.Catalog.__tablename__, tableid, limit)
 
 @app.get("/contexts/{contextid}/history", response_model=List[schemas.TableAudit])
-def get_context_history(contextid: int):
-    actions = ["INSERT", "UPDATE", "DELETE"]
-    history = []
-    for i in range(20):
-        history.append(schemas.TableAudit(
-            audit_id=i+1,
-            table_name="context",
-            record_id=contextid,
-            action=random.choice(actions),
-            old_data={"context_name": f"Context {contextid}", "desc": "Old description"},
-            new_data={"context_name": f"Context {contextid}", "desc": f"New description {i}"},
-            changed_by=f"user{i%3}",
-            changed_at=f"2024-06-0{(i%9)+1}T12:00:00",
-            change_reason="Mocked change"
-        ))
-    return history
+def get_context_history(contextid: int, limit: int = Query(50, ge=1, le=1000), db: Session = Depends(get_dev_db)):
+    return crud.get_record_history(db, models.Context.__tablename__, contextid, limit)
 
 @app.post("/systems/")
 def create_system(system: schemas.SystemBase, db: Session = Depends(get_dev_db)):
@@ -187,6 +472,7 @@ def create_system(system: schemas.SystemBase, db: Session = Depends(get_dev_db))
     db.add(new_system)
     db.commit()
     db.refresh(new_system)
+    events.publish_record(new_system, "dev", "created")
     return schemas.System.from_orm(new_system)
 
 @app.get("/systems/")
@@ -199,6 +485,7 @@ def create_role(role: schemas.RoleBase, db: Session = Depends(get_dev_db)):
     db.add(new_role)
     db.commit()
     db.refresh(new_role)
+    events.publish_record(new_role, "dev", "created")
     return schemas.Role.from_orm(new_role)
 
 @app.get("/roles/by_system/{systemid}")
@@ -216,83 +503,179 @@ def create_category(category: schemas.CategoryBase, db: Session = Depends(get_de
     db.add(new_category)
     db.commit()
     db.refresh(new_category)
+    events.publish_record(new_category, "dev", "created")
     return schemas.Category.from_orm(new_category)
 
 @app.get("/categories/by_system/{systemid}")
 def list_categories_by_system(systemid: int, db: Session = Depends(get_dev_db)):
     return [schemas.Category.from_orm(c) for c in db.query(models.Category).filter(models.Category.systemid == systemid).all()]
 
-class CategoryIdRequest(BaseModel):
-    categoryid: int
+def get_source_config(db: Session, categoryid: int):
+    category = crud.get_category_by_id(db, categoryid)
+    if not category:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return sources.decode_preferences(category.category_preferences)
 
 @app.post("/db/list_schemas/")
 def list_schemas(request_body: schemas.CategoryIdRequest, db: Session = Depends(get_dev_db)):
-    categoryid = request_body.categoryid
+    db_type, creds = get_source_config(db, request_body.categoryid)
     # Only Postgres for now
-    category = db.query(models.Category).filter(models.Category.categoryid == categoryid).first()
-    prefs = json.loads(category.category_preferences)
-    if prefs["db_type"] != "postgres":
+    if db_type != "postgres":
         return []
-    creds = json.loads(base64.b64decode(prefs["credentials"]).decode())
-    import psycopg2
-    conn = psycopg2.connect(database=creds["database"], user=creds["user"], password=creds["password"], host=creds["host"], port=creds["port"])
-    cur = conn.cursor()
-    cur.execute("SELECT schema_name FROM information_schema.schemata;")
-    schemas_list = [row[0] for row in cur.fetchall()]
-    cur.close()
-    conn.close()
-    return schemas_list
+    return sources.list_schemas(request_body.categoryid, creds)
 
 @app.post("/db/list_tables/")
-def list_tables(request_body: schemas.CategoryIdRequest, schema: str = Body(...), db: Session = Depends(get_dev_db)):
-    categoryid = request_body.categoryid
-    category = db.query(models.Category).filter(models.Category.categoryid == categoryid).first()
-    prefs = json.loads(category.category_preferences)
-    if prefs["db_type"] != "postgres":
+def list_tables(request_body: schemas.SchemaRequest, db: Session = Depends(get_dev_db)):
+    db_type, creds = get_source_config(db, request_body.categoryid)
+    if db_type != "postgres":
         return []
-    creds = json.loads(base64.b64decode(prefs["credentials"]).decode())
-    import psycopg2
-    conn = psycopg2.connect(database=creds["database"], user=creds["user"], password=creds["password"], host=creds["host"], port=creds["port"])
-    cur = conn.cursor()
-    cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = %s;", (schema,))
-    tables_list = [row[0] for row in cur.fetchall()]
-    cur.close()
-    conn.close()
-    return tables_list
+    return sources.list_tables(request_body.categoryid, creds, request_body.schema_name)
+
+@app.post("/db/schema_tree/")
+def schema_tree(request_body: schemas.SchemaTreeRequest, db: Session = Depends(get_dev_db)):
+    """Schemas, tables and columns of a source database in a single call"""
+    db_type, creds = get_source_config(db, request_body.categoryid)
+    if db_type != "postgres":
+        return []
+    return sources.schema_tree(request_body.categoryid, creds, request_body.schema_name)
+
+@app.post("/db/refresh_introspection/")
+def refresh_introspection(request_body: schemas.SchemaTreeRequest):
+    invalidated = sources.invalidate_introspection(request_body.categoryid, request_body.schema_name)
+    return {"status": "success", "invalidated": invalidated}
+
+@app.get("/db/source_pools/")
+def list_source_pools():
+    return sources.registry.stats()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Read cache size, hit ratio and change listener state of this worker"""
+    return read_cache.stats()
+
+@app.get("/db/pools")
+def list_db_pools():
+    """Connection pool usage per environment; engines not used yet are reported as uninitialized"""
+    return db.pool_stats()
+
+@app.on_event("shutdown")
+def close_source_pools():
+    sources.registry.close_all()
+    read_cache.stop_listeners()
+    db.dispose_all()
+
+def parse_table_names(names: Optional[List[str]]):
+    tables = []
+    for name in names or []:
+        schema, _, table = name.partition(".")
+        if not table:
+            raise HTTPException(status_code=400, detail=f"Expected schema.table, got {name}")
+        tables.append((schema, table))
+    return tables
 
 @app.post("/db/generate_metadata/")
-def generate_metadata(request_body: schemas.CategoryIdRequest, schema: str = Body(...), table: str = Body(...)):
-    categoryid = request_body.categoryid
-    # Placeholder request body
-    api_url = os.getenv("METADATA_API_URL", "http://localhost:8001/generate_metadata")
-    req_body = {"categoryid": categoryid, "schema": schema, "table": table}
-    resp = requests.post(api_url, json=req_body)
-    return resp.json()
+def generate_metadata(request_body: schemas.MetadataRequest, db: Session = Depends(get_dev_db)):
+    db_type, creds = get_source_config(db, request_body.categoryid)
+    # Profiling and generation can take a while; no need to hold a dev connection.
+    db.close()
+    profile = metadata_jobs.profile_or_none(request_body.categoryid, creds if db_type == "postgres" else None, request_body.schema_name, request_body.table)
+    try:
+        return metadata_jobs.generate(request_body.categoryid, request_body.schema_name, request_body.table, profile)
+    except requests.RequestException as exc:
+        raise HTTPException(status_code=502, detail=f"Metadata service error: {exc}")
+
+@app.post("/db/generate_metadata/jobs/")
+def submit_metadata_job(request_body: schemas.MetadataJobRequest, db: Session = Depends(get_dev_db)):
+    """Queue metadata generation for many tables ("schema.table") or a whole schema"""
+    tables = parse_table_names(request_body.tables)
+    db_type, creds = get_source_config(db, request_body.categoryid)
+    if db_type != "postgres":
+        creds = None
+    if request_body.schema_name and creds is not None:
+        tables.extend((request_body.schema_name, t) for t in sources.list_tables(request_body.categoryid, creds, request_body.schema_name))
+    if not tables:
+        raise HTTPException(status_code=400, detail="Provide tables or a schema with tables")
+    job = metadata_jobs.submit_job(request_body.categoryid, list(dict.fromkeys(tables)), creds)
+    return job.summary(include_results=False)
+
+@app.post("/db/profile/")
+def profile_source_tables(request_body: schemas.ProfileRequest, db: Session = Depends(get_dev_db)):
+    """Column profiles of source tables ("schema.table") or a whole schema, reusing stored ones while fresh"""
+    db_type, creds = get_source_config(db, request_body.categoryid)
+    db.close()
+    if db_type != "postgres":
+        raise HTTPException(status_code=400, detail="Profiling is only supported for postgres sources")
+    tables = parse_table_names(request_body.tables)
+    if request_body.schema_name:
+        tables.extend((request_body.schema_name, t) for t in sources.list_tables(request_body.categoryid, creds, request_body.schema_name))
+    if not tables:
+        raise HTTPException(status_code=400, detail="Provide tables or a schema with tables")
+    return profiling.profile_tables(request_body.categoryid, creds, list(dict.fromkeys(tables)), request_body.refresh)
+
+@app.get("/db/generate_metadata/jobs/{job_id}")
+def get_metadata_job(job_id: str, results: bool = True):
+    job = metadata_jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.summary(include_results=results)
+
+def document_response(request: Request, rendered, not_found: str):
+    if rendered is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    etag, body = rendered
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if documents.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/catalogs/{tableid}/full")
+def get_full_catalog(request: Request, tableid: int, env: str = "dev", db: Session = Depends(get_env_db)):
+    return document_response(request, documents.full_catalog(db, env, tableid=tableid), "Catalog not found")
 
 @app.get("/catalogs/full/{table_vector_id}")
-def get_full_catalog_by_vector_id(table_vector_id: str, db: Session = Depends(get_dev_db)):
-    # Fetch main catalog info
-    catalog = db.query(models.Catalog).filter(models.Catalog.table_vector_id == table_vector_id).first()
-    if not catalog:
+def get_full_catalog_by_vector_id(request: Request, table_vector_id: str, env: str = "dev", db: Session = Depends(get_env_db)):
+    return document_response(request, documents.full_catalog(db, env, table_vector_id=table_vector_id), "Catalog not found")
+
+def profile_catalog_source(db: Session, catalog) -> Dict[str, Any]:
+    """A new profile of the catalog's source table; nothing is stored"""
+    try:
+        categoryid, schema, table = profiling.catalog_source(catalog)
+    except LookupError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    db_type, creds = get_source_config(db, categoryid)
+    if db_type != "postgres":
+        raise HTTPException(status_code=400, detail="Profiling is only supported for postgres sources")
+    db.rollback()
+    try:
+        return profiling.profile_table(categoryid, creds, schema, table)
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+
+@app.get("/catalogs/{tableid}/profile")
+def get_catalog_profile(tableid: int, env: str = "dev", db: Session = Depends(get_env_db)):
+    """Stored column profile of the catalog's source table; profiled again, without storing, when missing or stale"""
+    catalog = crud.get_full_catalog(db, tableid=tableid)
+    if catalog is None:
         raise HTTPException(status_code=404, detail="Catalog not found")
-    # Mock: fetch related info (rules, usage_patterns, columns, samples)
-    # In real code, join or query related tables as in your screenshots
-    # Here, just return catalog info for now
-    catalog_dict = {**catalog.__dict__}
-    catalog_dict.pop('_sa_instance_state', None)
-    # TODO: Add real joins for rules, usage_patterns, columns, samples
-    catalog_dict['rules'] = catalog.rules
-    catalog_dict['usage_patterns'] = catalog.usage_patterns
-    catalog_dict['columns'] = catalog.columns
-    catalog_dict['samples'] = []  # Placeholder
-    return catalog_dict
+    profile = profiling.stored_profile(catalog.sample)
+    if profile is not None:
+        return profile
+    return profile_catalog_source(db, catalog)
+
+@app.post("/catalogs/{tableid}/profile")
+def refresh_catalog_profile(tableid: int, env: str = "dev", db: Session = Depends(get_env_db)):
+    """Profile the catalog's source table again and store the result with the catalog in env"""
+    catalog = crud.get_full_catalog(db, tableid=tableid)
+    if catalog is None:
+        raise HTTPException(status_code=404, detail="Catalog not found")
+    profile = profile_catalog_source(db, catalog)
+    profiling.store_profile(db, tableid, profile)
+    return profile
+
+@app.get("/contexts/{contextid}/full")
+def get_full_context(request: Request, contextid: int, env: str = "dev", db: Session = Depends(get_env_db)):
+    return document_response(request, documents.full_context(db, env, contextid=contextid), "Context not found")
 
 @app.get("/contexts/full/{context_vector_id}")
-def get_full_context_by_vector_id(context_vector_id: str, db: Session = Depends(get_dev_db)):
-    context = db.query(models.Context).filter(models.Context.context_vector_id == context_vector_id).first()
-    if not context:
-        raise HTTPException(status_code=404, detail="Context not found")
-    context_dict = {**context.__dict__}
-    context_dict.pop('_sa_instance_state', None)
-    # TODO: Add real joins for related tables
-    return context_dict 
\ No newline at end of file
+def get_full_context_by_vector_id(request: Request, context_vector_id: str, env: str = "dev", db: Session = Depends(get_env_db)):
+    return document_response(request, documents.full_context(db, env, context_vector_id=context_vector_id), "Context not found")
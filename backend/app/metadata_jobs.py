@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from . import metrics, profiling
+
+METADATA_API_URL = os.getenv("METADATA_API_URL", "http://localhost:8001/generate_metadata")
+METADATA_CONCURRENCY = int(os.getenv("METADATA_CONCURRENCY", "4"))
+METADATA_RETRIES = int(os.getenv("METADATA_RETRIES", "3"))
+METADATA_BACKOFF = float(os.getenv("METADATA_BACKOFF", "0.5"))
+METADATA_TIMEOUT = float(os.getenv("METADATA_TIMEOUT", "300"))
+METADATA_JOB_HISTORY = int(os.getenv("METADATA_JOB_HISTORY", "100"))
+
+logger = logging.getLogger("autobi.metadata")
+
+def _make_http_session() -> requests.Session:
+    retry = Retry(
+        total=METADATA_RETRIES,
+        backoff_factor=METADATA_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"POST"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=METADATA_CONCURRENCY, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http = _make_http_session()
+
+def generate(categoryid: int, schema: str, table: str, profile: Optional[Dict[str, Any]] = None) -> Any:
+    """Ask the metadata service for one table, over the shared keep-alive session"""
+    payload = {"categoryid": categoryid, "schema": schema, "table": table}
+    if profile is not None:
+        payload["profile"] = profile
+    with metrics.track("metadata_api"):
+        resp = http.post(METADATA_API_URL, json=payload, timeout=METADATA_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json()
+
+class MetadataJob:
+    def __init__(self, categoryid: int, tables: List[Tuple[str, str]], creds: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.categoryid = categoryid
+        self.tables = tables
+        self.creds = creds
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def record(self, schema: str, table: str, result: Dict[str, Any]):
+        with self._lock:
+            self.results[f"{schema}.{table}"] = result
+            if len(self.results) == len(self.tables):
+                self.finished_at = time.time()
+
+    def status(self) -> str:
+        if self.finished_at is None:
+            return "running" if self.results else "queued"
+        return "failed" if any(r["status"] == "error" for r in self.results.values()) else "completed"
+
+    def summary(self, include_results: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            results = dict(self.results)
+        failed = sum(1 for r in results.values() if r["status"] == "error")
+        summary = {
+            "job_id": self.id,
+            "categoryid": self.categoryid,
+            "status": self.status(),
+            "total": len(self.tables),
+            "completed": len(results) - failed,
+            "failed": failed,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if include_results:
+            summary["results"] = results
+        return summary
+
+# One executor for all jobs, so METADATA_CONCURRENCY bounds the load on the
+# upstream generator no matter how many jobs are queued.
+_executor = ThreadPoolExecutor(max_workers=METADATA_CONCURRENCY, thread_name_prefix="metadata")
+_jobs: "OrderedDict[str, MetadataJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+def profile_or_none(categoryid: int, creds: Optional[Dict[str, Any]], schema: str, table: str) -> Optional[Dict[str, Any]]:
+    """Column profile to send with a generation request; generation goes ahead without one"""
+    if creds is None:
+        return None
+    try:
+        return profiling.cached_profile(categoryid, creds, schema, table)
+    except Exception:
+        logger.warning("Profiling %s.%s for category %s failed", schema, table, categoryid, exc_info=True)
+        return None
+
+def _run_table(job: MetadataJob, schema: str, table: str):
+    try:
+        profile = profile_or_none(job.categoryid, job.creds, schema, table)
+        job.record(schema, table, {"status": "done", "metadata": generate(job.categoryid, schema, table, profile)})
+    except Exception as exc:
+        job.record(schema, table, {"status": "error", "error": f"{exc.__class__.__name__}: {exc}"})
+
+def submit_job(categoryid: int, tables: List[Tuple[str, str]], creds: Optional[Dict[str, Any]] = None) -> MetadataJob:
+    job = MetadataJob(categoryid, tables, creds)
+    if not tables:
+        job.finished_at = job.created_at
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > METADATA_JOB_HISTORY:
+            _jobs.popitem(last=False)
+    for schema, table in tables:
+        _executor.submit(_run_table, job, schema, table)
+    return job
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        return _jobs.get(job_id)
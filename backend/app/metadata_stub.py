@@ -0,0 +1,29 @@
+"""Local stand-in for the metadata generation service.
+
+Run with `poetry run uvicorn app.metadata_stub:app --port 8001` and point
+METADATA_API_URL at it (the default already does).
+"""
+import asyncio
+import os
+import random
+from typing import Optional
+from fastapi import FastAPI, Body, HTTPException
+
+STUB_DELAY_SECONDS = float(os.getenv("STUB_DELAY_SECONDS", "1.0"))
+STUB_FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", "0.0"))
+
+app = FastAPI()
+
+@app.post("/generate_metadata")
+async def generate_metadata(categoryid: int = Body(...), schema: str = Body(...), table: str = Body(...), profile: Optional[dict] = Body(None)):
+    await asyncio.sleep(STUB_DELAY_SECONDS)
+    if random.random() < STUB_FAILURE_RATE:
+        raise HTTPException(status_code=503, detail="Stub failure")
+    return {
+        "categoryid": categoryid,
+        "table_name": f"{schema}.{table}",
+        "table_description": f"Generated description for {schema}.{table}",
+        "columns": [{"name": c["name"], "type": c["type"]} for c in (profile or {}).get("columns", [])],
+        "rules": [],
+        "usage_patterns": [],
+    }
@@ -0,0 +1,221 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_LOG_CHARS = 1000
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_query_log = logging.getLogger("autobi.slow_query")
+
+METRICS = {
+    "autobi_http_requests_total": ("counter", "HTTP requests by route and status"),
+    "autobi_http_request_duration_seconds": ("histogram", "HTTP request latency by route"),
+    "autobi_http_response_bytes_total": ("counter", "Response bytes sent by route, after compression"),
+    "autobi_db_queries_total": ("counter", "SQL statements by route and environment"),
+    "autobi_db_seconds_total": ("counter", "Time spent in SQL by route and environment"),
+    "autobi_db_query_duration_seconds": ("histogram", "SQL statement latency by environment"),
+    "autobi_slow_queries_total": ("counter", "SQL statements slower than SLOW_QUERY_MS by environment"),
+    "autobi_timing_seconds_total": ("counter", "Serialization, source database and metadata API time by route"),
+    "autobi_timing_duration_seconds": ("histogram", "Latency of individual serialization, source database and metadata API calls"),
+    "autobi_cache_lookups_total": ("counter", "Read cache lookups by kind and result (hit or miss)"),
+    "autobi_cache_evictions_total": ("counter", "Read cache entries evicted to stay under READ_CACHE_MAX_BYTES"),
+    "autobi_cache_invalidations_total": ("counter", "Read cache entries dropped because their tables changed"),
+    "autobi_cache_bytes": ("gauge", "Estimated bytes held by the read cache"),
+    "autobi_cache_entries": ("gauge", "Entries in the read cache"),
+}
+
+class _Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], _Histogram] = {}
+
+def inc(name: str, value: float = 1.0, **labels: str):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+def set_value(name: str, value: float, **labels: str):
+    """Set a gauge, or a counter kept elsewhere, to its current value"""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = value
+
+def observe(name: str, value: float, **labels: str):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram()
+        histogram.observe(value)
+
+class RequestStats:
+    """What one request spent, filled in from whichever thread does the work"""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries: Dict[str, int] = {}
+        self.db_seconds: Dict[str, float] = {}
+        self.timings: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def route(self) -> str:
+        # The router stores the matched route in the shared scope before the
+        # endpoint runs, so hooks fired during the request can label by it.
+        return getattr(self.scope.get("route"), "path", None) or "unmatched"
+
+    def add_query(self, env: str, seconds: float):
+        with self._lock:
+            self.queries[env] = self.queries.get(env, 0) + 1
+            self.db_seconds[env] = self.db_seconds.get(env, 0.0) + seconds
+
+    def add_timing(self, kind: str, seconds: float):
+        with self._lock:
+            self.timings[kind] = self.timings.get(kind, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        with self._lock:
+            parts = [f"db-{env};dur={seconds * 1000:.1f};desc=\"{self.queries[env]} queries\"" for env, seconds in self.db_seconds.items()]
+            parts += [f"{kind};dur={seconds * 1000:.1f}" for kind, seconds in self.timings.items()]
+        return ", ".join(parts)
+
+# The middleware sets this per request; threadpool handlers and
+# run_in_db_executor copy the context, so hooks there see the same stats.
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+def _route_label() -> str:
+    stats = current_request.get()
+    return stats.route if stats is not None else "background"
+
+def record_query(env: str, statement: str, seconds: float):
+    route = _route_label()
+    stats = current_request.get()
+    if stats is not None:
+        stats.add_query(env, seconds)
+    inc("autobi_db_queries_total", route=route, env=env)
+    inc("autobi_db_seconds_total", seconds, route=route, env=env)
+    observe("autobi_db_query_duration_seconds", seconds, env=env)
+    if SLOW_QUERY_MS > 0 and seconds * 1000 >= SLOW_QUERY_MS:
+        inc("autobi_slow_queries_total", env=env)
+        slow_query_log.warning("%.1fms env=%s route=%s %s", seconds * 1000, env, route, " ".join(statement.split())[:SLOW_QUERY_LOG_CHARS])
+
+@contextmanager
+def track(kind: str):
+    """Time a block as serialization, source_db, metadata_api, ... for the current route"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        stats = current_request.get()
+        if stats is not None:
+            stats.add_timing(kind, seconds)
+        inc("autobi_timing_seconds_total", seconds, route=_route_label(), kind=kind)
+        observe("autobi_timing_duration_seconds", seconds, kind=kind)
+
+def instrument_engine(engine, env: str):
+    """Count and time every statement the engine runs, attributed to env"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_query(env, statement, time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection is not None else None
+        if started:
+            record_query(env, exception_context.statement or "", time.perf_counter() - started.pop())
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        with track("serialization"):
+            return super().render(content)
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming bodies pass through untouched"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status, sent = 500, 0
+
+        async def send_with_metrics(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing = stats.server_timing()
+                if timing:
+                    # The frontend is served from another origin and needs Timing-Allow-Origin to read it.
+                    extra = [(b"server-timing", timing.encode()), (b"timing-allow-origin", b"*")]
+                    message = dict(message, headers=list(message.get("headers", [])) + extra)
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            current_request.reset(token)
+            route, method = stats.route, scope["method"]
+            inc("autobi_http_requests_total", route=route, method=method, status=str(status))
+            inc("autobi_http_response_bytes_total", sent, route=route, method=method)
+            observe("autobi_http_request_duration_seconds", time.perf_counter() - started, route=route, method=method)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: Tuple[Tuple[str, str], ...], **extra: str) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (list(h.counts), h.sum) for key, h in _histograms.items()}
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        if kind in ("counter", "gauge"):
+            lines += [f"{name}{_labels(labels)} {value}" for (metric, labels), value in sorted(counters.items()) if metric == name]
+            continue
+        for (metric, labels), (counts, total) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels, le=le)} {cumulative}")
+            lines += [f"{name}_sum{_labels(labels)} {total}", f"{name}_count{_labels(labels)} {cumulative}"]
+    return "\n".join(lines) + "\n"
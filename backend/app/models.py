@@ -1,5 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Index, func, text
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
+from sqlalchemy.schema import CreateTable
 from datetime import datetime
 
 Base = declarative_base()
@@ -22,7 +25,7 @@ class Role(Base):
     __table_args__ = {"schema":"autobi"}
     roleid = Column(Integer, primary_key=True, index=True)
     rolename = Column(String(255))
-    systemid = Column(Integer, ForeignKey("systems.systemid"))
+    systemid = Column(Integer, ForeignKey("autobi.systems.systemid"))
     description = Column(Text)
     role_preferences = Column(JSON)
     date_created = Column(DateTime)
@@ -34,18 +37,36 @@ class Category(Base):
     __table_args__ = {"schema":"autobi"}
     categoryid = Column(Integer, primary_key=True, index=True)
     categoryname = Column(String(255))
-    systemid = Column(Integer, ForeignKey("systems.systemid"))
+    systemid = Column(Integer, ForeignKey("autobi.systems.systemid"))
     description = Column(Text)
     category_preferences = Column(JSON)
     date_created = Column(DateTime)
     date_updated = Column(DateTime)
     status = Column(String(50))
 
+# Full-text documents behind /catalogs/search and /contexts/search. The GIN
+# expression indexes below are built from the same SQL, which is what lets
+# search queries use them; names and ids are not stemmed, descriptions are.
+CATALOG_SEARCH_DOCUMENT = """(
+    setweight(to_tsvector('simple', coalesce(table_name, '') || ' ' || coalesce(table_vector_id, '')), 'A')
+    || setweight(jsonb_to_tsvector('simple', coalesce(jsonb_path_query_array(columns::jsonb, '$[*].name'), '[]'::jsonb), '["string"]'), 'B')
+    || setweight(to_tsvector('english', coalesce(table_description, '')), 'C')
+)"""
+CONTEXT_SEARCH_DOCUMENT = """(
+    setweight(to_tsvector('simple', coalesce(context_name, '') || ' ' || coalesce(context_vector_id, '')), 'A')
+    || setweight(jsonb_to_tsvector('simple', coalesce(jsonb_path_query_array(columns::jsonb, '$[*].name'), '[]'::jsonb), '["string"]'), 'B')
+    || setweight(jsonb_to_tsvector('simple', coalesce(relevanttables::jsonb, '[]'::jsonb), '["string"]'), 'B')
+    || setweight(to_tsvector('english', coalesce(context_description, '')), 'C')
+)"""
+
 class Catalog(Base):
     __tablename__ = "catalog"
-    __table_args__ = {"schema":"autobi"}
+    __table_args__ = (
+        Index("ix_catalog_search", text(CATALOG_SEARCH_DOCUMENT), postgresql_using="gin"),
+        {"schema":"autobi"},
+    )
     tableid = Column(Integer, primary_key=True, index=True)
-    table_vector_id = Column(String)
+    table_vector_id = Column(String, index=True)
     table_name = Column(String)
     table_description = Column(Text)
     rules = Column(JSON)
@@ -54,12 +75,37 @@ class Catalog(Base):
     date_created = Column(DateTime)
     date_updated = Column(DateTime)
     archive = Column(Integer)
+    # Only loaded on request (selectinload) for full documents.
+    mappings = relationship("CatalogMapping", lazy="raise")
+    sample = relationship("CatalogSample", uselist=False, lazy="raise")
+
+class CatalogMapping(Base):
+    __tablename__ = "catalog_mapping"
+    __table_args__ = {"schema":"autobi"}
+    mappingid = Column(Integer, primary_key=True)
+    tableid = Column(Integer, ForeignKey("autobi.catalog.tableid"), nullable=False, index=True)
+    roleid = Column(Integer, ForeignKey("autobi.roles.roleid"))
+    categoryid = Column(Integer, ForeignKey("autobi.category.categoryid"))
+    systemid = Column(Integer, ForeignKey("autobi.systems.systemid"))
+
+class CatalogSample(Base):
+    __tablename__ = "catalog_sample"
+    __table_args__ = {"schema":"autobi"}
+    tableid = Column(Integer, ForeignKey("autobi.catalog.tableid"), primary_key=True)
+    samples = Column(JSON)
+    date_updated = Column(DateTime)
+    # Column profile of the source table, written by profiling.store_profile.
+    profile = Column(JSON)
+    profiled_at = Column(DateTime)
 
 class Context(Base):
     __tablename__ = "context"
-    __table_args__ = {"schema":"autobi"}
+    __table_args__ = (
+        Index("ix_context_search", text(CONTEXT_SEARCH_DOCUMENT), postgresql_using="gin"),
+        {"schema":"autobi"},
+    )
     contextid = Column(Integer, primary_key=True, index=True)
-    context_vector_id = Column(String)
+    context_vector_id = Column(String, index=True)
     context_name = Column(String)
     context_description = Column(Text)
     table_descriptions = Column(JSON)
@@ -73,39 +119,195 @@ class Context(Base):
 
 class TableAudit(Base):
     __tablename__ = "table_audit"
-    __table_args__ = {"schema":"autobi"}
-    audit_id = Column(Integer, primary_key=True)
+    # Monthly range partitions on changed_at, managed by app/partitions.py.
+    # Postgres requires the partition key in the primary key.
+    __table_args__ = {"schema":"autobi", "postgresql_partition_by": "RANGE (changed_at)"}
+    audit_id = Column(Integer, primary_key=True, autoincrement=True)
     table_name = Column(String(255), nullable=False)
     record_id = Column(Integer, nullable=False)
     action = Column(String(10), nullable=False)  # INSERT, UPDATE, DELETE
     old_data = Column(JSON)
     new_data = Column(JSON)
     changed_by = Column(String(255))
-    changed_at = Column(DateTime, default=datetime.utcnow)
+    changed_at = Column(DateTime, primary_key=True, default=datetime.utcnow, server_default=func.now())
     change_reason = Column(Text)
 
+# Serve per-record history and keyset-paginated table history newest first.
+Index("ix_table_audit_record_history", TableAudit.table_name, TableAudit.record_id, TableAudit.changed_at.desc(), TableAudit.audit_id.desc())
+Index("ix_table_audit_table_history", TableAudit.table_name, TableAudit.changed_at.desc(), TableAudit.audit_id.desc())
+
+class TableAuditSnapshot(Base):
+    """Full record state left behind when an expired audit partition is compacted"""
+    __tablename__ = "table_audit_snapshot"
+    __table_args__ = {"schema":"autobi"}
+    table_name = Column(String(255), primary_key=True)
+    record_id = Column(Integer, primary_key=True)
+    last_audit_id = Column(Integer, nullable=False)
+    snapshot_at = Column(DateTime, nullable=False)
+    data = Column(JSON)
+
+class ReplicationWatermark(Base):
+    """Last dev audit entry replayed into prod, per table; lives in the prod database"""
+    __tablename__ = "replication_watermark"
+    __table_args__ = {"schema":"autobi"}
+    table_name = Column(String(255), primary_key=True)
+    last_audit_id = Column(Integer, nullable=False, default=0)
+    last_changed_at = Column(DateTime)
+    date_updated = Column(DateTime)
+
+AUDITED_MODELS = {model.__tablename__: model for model in (System, Role, Category, Catalog, Context)}
+AUDIT_MODES = ("full", "delta")
+
 # Function to create audit trigger
-def create_audit_trigger(table_name):
+def create_audit_trigger(table_name, record_key="id", mode="full"):
+    """Audit trigger for autobi.<table_name>.
+
+    In "delta" mode an UPDATE stores only the keys whose values changed (old
+    values in old_data, new values in new_data) and no-op updates are not
+    recorded; INSERT and DELETE always store the full row image. Entries are
+    stamped with clock_timestamp(), the time of the write rather than of the
+    transaction start, which replication.read_changes relies on.
+    """
+    if mode == "delta":
+        update_sql = f"""
+            SELECT jsonb_object_agg(n.key, o.value), jsonb_object_agg(n.key, n.value)
+              INTO old_delta, new_delta
+              FROM jsonb_each(to_jsonb(NEW)) n
+              JOIN jsonb_each(to_jsonb(OLD)) o ON o.key = n.key
+             WHERE n.value IS DISTINCT FROM o.value;
+            IF new_delta IS NULL THEN
+                RETURN NEW;
+            END IF;
+            INSERT INTO autobi.table_audit (table_name, record_id, action, old_data, new_data, changed_at)
+            VALUES ('{table_name}', NEW.{record_key}, 'UPDATE', old_delta::json, new_delta::json, clock_timestamp());"""
+    else:
+        update_sql = f"""
+            INSERT INTO autobi.table_audit (table_name, record_id, action, old_data, new_data, changed_at)
+            VALUES ('{table_name}', NEW.{record_key}, 'UPDATE', row_to_json(OLD), row_to_json(NEW), clock_timestamp());"""
     return f"""
-    CREATE OR REPLACE FUNCTION {table_name}_audit_trigger()
+    CREATE OR REPLACE FUNCTION autobi.{table_name}_audit_trigger()
     RETURNS TRIGGER AS $$
+    DECLARE
+        old_delta jsonb;
+        new_delta jsonb;
     BEGIN
         IF (TG_OP = 'DELETE') THEN
-            INSERT INTO table_audit (table_name, record_id, action, old_data, changed_at)
-            VALUES ('{table_name}', OLD.id, 'DELETE', row_to_json(OLD), NOW());
+            INSERT INTO autobi.table_audit (table_name, record_id, action, old_data, changed_at)
+            VALUES ('{table_name}', OLD.{record_key}, 'DELETE', row_to_json(OLD), clock_timestamp());
             RETURN OLD;
-        ELSIF (TG_OP = 'UPDATE') THEN
-            INSERT INTO table_audit (table_name, record_id, action, old_data, new_data, changed_at)
-            VALUES ('{table_name}', NEW.id, 'UPDATE', row_to_json(OLD), row_to_json(NEW), NOW());
+        ELSIF (TG_OP = 'UPDATE') THEN{update_sql}
             RETURN NEW;
         ELSIF (TG_OP = 'INSERT') THEN
-            INSERT INTO table_audit (table_name, record_id, action, new_data, changed_at)
-            VALUES ('{table_name}', NEW.id, 'INSERT', row_to_json(NEW), NOW());
+            INSERT INTO autobi.table_audit (table_name, record_id, action, new_data, changed_at)
+            VALUES ('{table_name}', NEW.{record_key}, 'INSERT', row_to_json(NEW), clock_timestamp());
             RETURN NEW;
         END IF;
         RETURN NULL;
     END;
     $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS {table_name}_audit ON autobi.{table_name};
+    CREATE TRIGGER {table_name}_audit
+    AFTER INSERT OR UPDATE OR DELETE ON autobi.{table_name}
+    FOR EACH ROW EXECUTE FUNCTION autobi.{table_name}_audit_trigger();
     """
 
-# Add mapping and sample tables if needed later 
\ No newline at end of file
+# Rebuilds a record's full state as of an audit entry. Works for both trigger
+# modes: it replays forward from the latest full image at or before the point
+# (an INSERT, or a snapshot left by partition compaction), or, when the record
+# predates auditing, walks back from the current row undoing later changes.
+AUDIT_ROW_STATE_FUNCTION = """
+CREATE OR REPLACE FUNCTION autobi.audit_row_state(p_table_name text, p_record_key text, p_record_id integer, p_audit_id integer)
+RETURNS jsonb AS $$
+DECLARE
+    state jsonb;
+    base_id integer;
+    snapshot_id integer;
+    snapshot_state jsonb;
+    entry record;
+BEGIN
+    SELECT audit_id, new_data::jsonb INTO base_id, state
+      FROM autobi.table_audit
+     WHERE table_name = p_table_name AND record_id = p_record_id
+       AND audit_id <= p_audit_id AND action = 'INSERT'
+     ORDER BY audit_id DESC LIMIT 1;
+
+    SELECT last_audit_id, data::jsonb INTO snapshot_id, snapshot_state
+      FROM autobi.table_audit_snapshot
+     WHERE table_name = p_table_name AND record_id = p_record_id
+       AND last_audit_id <= p_audit_id AND last_audit_id > coalesce(base_id, 0);
+    IF snapshot_id IS NOT NULL THEN
+        base_id := snapshot_id;
+        state := snapshot_state;
+    END IF;
+
+    IF base_id IS NOT NULL THEN
+        FOR entry IN
+            SELECT action, new_data::jsonb AS new_data FROM autobi.table_audit
+             WHERE table_name = p_table_name AND record_id = p_record_id
+               AND audit_id > base_id AND audit_id <= p_audit_id
+             ORDER BY audit_id
+        LOOP
+            state := CASE entry.action
+                WHEN 'UPDATE' THEN state || entry.new_data
+                WHEN 'INSERT' THEN entry.new_data
+                ELSE NULL
+            END;
+        END LOOP;
+        RETURN state;
+    END IF;
+
+    EXECUTE format('SELECT to_jsonb(t) FROM autobi.%I t WHERE %I = $1', p_table_name, p_record_key)
+       INTO state USING p_record_id;
+    FOR entry IN
+        SELECT action, old_data::jsonb AS old_data FROM autobi.table_audit
+         WHERE table_name = p_table_name AND record_id = p_record_id AND audit_id > p_audit_id
+         ORDER BY audit_id DESC
+    LOOP
+        state := CASE entry.action
+            WHEN 'UPDATE' THEN state || entry.old_data
+            WHEN 'DELETE' THEN entry.old_data
+            ELSE NULL
+        END;
+    END LOOP;
+    RETURN state;
+END;
+$$ LANGUAGE plpgsql STABLE;
+"""
+
+def audit_ddl(mode="full"):
+    """All statements needed to audit the autobi tables in the given trigger mode"""
+    statements = [
+        str(CreateTable(TableAuditSnapshot.__table__, if_not_exists=True).compile(dialect=postgresql.dialect())),
+        AUDIT_ROW_STATE_FUNCTION,
+    ]
+    for table_name, model in AUDITED_MODELS.items():
+        statements.append(create_audit_trigger(table_name, model.__table__.primary_key.columns.values()[0].name, mode))
+    return statements
+ 
+# Tables whose writes invalidate the read caches of every worker, and the
+# channel the statement-level triggers below notify on.
+CACHE_NOTIFY_CHANNEL = "autobi_cache"
+CACHE_NOTIFY_MODELS = {model.__tablename__: model for model in (System, Role, Category, Catalog, CatalogMapping, CatalogSample, Context)}
+
+CACHE_NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION autobi.notify_cache() RETURNS trigger AS $$
+BEGIN
+    -- Delivered on commit, once per table per transaction.
+    PERFORM pg_notify('{CACHE_NOTIFY_CHANNEL}', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+def cache_notify_ddl():
+    """Statements that make every write to a cached table notify CACHE_NOTIFY_CHANNEL"""
+    statements = [CACHE_NOTIFY_FUNCTION]
+    for table_name in CACHE_NOTIFY_MODELS:
+        statements.append(f"""
+DROP TRIGGER IF EXISTS {table_name}_notify_cache ON autobi.{table_name};
+CREATE TRIGGER {table_name}_notify_cache
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON autobi.{table_name}
+FOR EACH STATEMENT EXECUTE FUNCTION autobi.notify_cache();
+""")
+    return statements
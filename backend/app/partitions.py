@@ -0,0 +1,142 @@
+import os
+import re
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional
+from sqlalchemy import bindparam, text
+from . import models
+
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3"))
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "12"))
+AUDIT_RETENTION_MODE = os.getenv("AUDIT_RETENTION_MODE", "compact")
+RETENTION_MODES = ("compact", "detach")
+
+PARTITION_NAME = re.compile(r"^table_audit_y(\d{4})m(\d{2})$")
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(start: date) -> str:
+    return f"table_audit_y{start.year}m{start.month:02d}"
+
+def list_partitions(conn) -> List[Dict[str, Any]]:
+    rows = conn.execute(text("""
+        SELECT c.relname FROM pg_catalog.pg_inherits i
+        JOIN pg_catalog.pg_class c ON c.oid = i.inhrelid
+        JOIN pg_catalog.pg_class p ON p.oid = i.inhparent
+        JOIN pg_catalog.pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = 'autobi' AND p.relname = 'table_audit'
+        ORDER BY c.relname
+    """))
+    partitions = []
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+        start = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+        partitions.append({"name": name, "start": start, "end": add_months(start, 1) if start else None})
+    return partitions
+
+def create_partition(conn, start: date) -> str:
+    name = partition_name(start)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS autobi.{name} PARTITION OF autobi.table_audit "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{add_months(start, 1).isoformat()}')"
+    ))
+    return name
+
+def ensure_partitions(conn, months_ahead: int = AUDIT_PARTITIONS_AHEAD, today: Optional[date] = None) -> List[str]:
+    """Create this month's partition and the next months_ahead, plus a default catch-all"""
+    current = month_start(today or date.today())
+    existing = {p["name"] for p in list_partitions(conn)}
+    created = []
+    for offset in range(months_ahead + 1):
+        start = add_months(current, offset)
+        if partition_name(start) not in existing:
+            created.append(create_partition(conn, start))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS autobi.table_audit_default PARTITION OF autobi.table_audit DEFAULT"))
+    return created
+
+def _record_key_case() -> str:
+    whens = " ".join(
+        f"WHEN '{table_name}' THEN '{model.__table__.primary_key.columns.values()[0].name}'"
+        for table_name, model in models.AUDITED_MODELS.items()
+    )
+    return f"CASE p.table_name {whens} END"
+
+def compact_partition(conn, name: str) -> int:
+    """Fold a partition into per-record snapshots of the last state it recorded"""
+    result = conn.execute(text(f"""
+        INSERT INTO autobi.table_audit_snapshot (table_name, record_id, last_audit_id, snapshot_at, data)
+        SELECT p.table_name, p.record_id, p.last_audit_id, p.last_changed_at,
+               autobi.audit_row_state(p.table_name, {_record_key_case()}, p.record_id, p.last_audit_id)::json
+        FROM (
+            SELECT table_name, record_id, max(audit_id) AS last_audit_id, max(changed_at) AS last_changed_at
+            FROM autobi.{name}
+            WHERE table_name IN :table_names
+            GROUP BY table_name, record_id
+        ) p
+        ON CONFLICT (table_name, record_id) DO UPDATE SET
+            last_audit_id = EXCLUDED.last_audit_id,
+            snapshot_at = EXCLUDED.snapshot_at,
+            data = EXCLUDED.data
+        WHERE autobi.table_audit_snapshot.last_audit_id < EXCLUDED.last_audit_id
+    """).bindparams(bindparam("table_names", list(models.AUDITED_MODELS), expanding=True)))
+    conn.execute(text(f"DROP TABLE autobi.{name}"))
+    return result.rowcount
+
+def apply_retention(conn, keep_months: int = AUDIT_RETENTION_MONTHS, mode: str = AUDIT_RETENTION_MODE, today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Compact or detach monthly partitions that ended before the retention window.
+
+    Partitions are processed oldest first so snapshots always move forward.
+    Detached partitions stay in the autobi schema as plain tables for archival.
+    """
+    if mode not in RETENTION_MODES:
+        raise ValueError(f"Unknown retention mode: {mode}")
+    cutoff = add_months(month_start(today or date.today()), -keep_months)
+    expired = sorted((p for p in list_partitions(conn) if p["end"] and p["end"] <= cutoff), key=lambda p: p["start"])
+    report = []
+    for partition in expired:
+        if mode == "compact":
+            snapshots = compact_partition(conn, partition["name"])
+            report.append({"partition": partition["name"], "action": "compacted", "snapshots": snapshots})
+        else:
+            conn.execute(text(f"ALTER TABLE autobi.table_audit DETACH PARTITION autobi.{partition['name']}"))
+            report.append({"partition": partition["name"], "action": "detached"})
+    return report
+
+def maintain(engine, months_ahead: int = AUDIT_PARTITIONS_AHEAD, keep_months: int = AUDIT_RETENTION_MONTHS, mode: str = AUDIT_RETENTION_MODE) -> Dict[str, Any]:
+    with engine.begin() as conn:
+        created = ensure_partitions(conn, months_ahead)
+        retention = apply_retention(conn, keep_months, mode)
+    return {"created": created, "retention": retention, "ran_at": datetime.utcnow().isoformat()}
+
+def migrate_to_partitioned(engine, months_ahead: int = AUDIT_PARTITIONS_AHEAD) -> Dict[str, Any]:
+    """One-off conversion of an existing unpartitioned autobi.table_audit.
+
+    The old table is kept as autobi.table_audit_legacy until dropped by hand.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE autobi.table_audit RENAME TO table_audit_legacy"))
+        conn.execute(text("ALTER INDEX IF EXISTS autobi.table_audit_pkey RENAME TO table_audit_legacy_pkey"))
+        for index in models.TableAudit.__table__.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS autobi.{index.name}"))
+        models.TableAudit.__table__.create(conn)
+        oldest = conn.execute(text("SELECT min(changed_at) FROM autobi.table_audit_legacy")).scalar()
+        start = month_start(oldest.date()) if oldest else month_start(date.today())
+        while start < month_start(date.today()):
+            create_partition(conn, start)
+            start = add_months(start, 1)
+        ensure_partitions(conn, months_ahead)
+        names = [c.name for c in models.TableAudit.__table__.columns]
+        selected = ["coalesce(changed_at, now())" if name == "changed_at" else name for name in names]
+        copied = conn.execute(text(
+            f"INSERT INTO autobi.table_audit ({', '.join(names)}) "
+            f"SELECT {', '.join(selected)} FROM autobi.table_audit_legacy"
+        )).rowcount
+        conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('autobi.table_audit', 'audit_id'), "
+            "coalesce((SELECT max(audit_id) FROM autobi.table_audit), 0) + 1, false)"
+        ))
+    return {"copied": copied}
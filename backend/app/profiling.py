@@ -0,0 +1,190 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+import psycopg2
+from psycopg2 import sql
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from . import db, models, sources, documents, metrics
+
+PROFILE_SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "1000"))
+PROFILE_TIMEOUT_MS = int(os.getenv("PROFILE_TIMEOUT_MS", "5000"))
+PROFILE_CONCURRENCY = int(os.getenv("PROFILE_CONCURRENCY", "4"))
+PROFILE_MAX_AGE_HOURS = float(os.getenv("PROFILE_MAX_AGE_HOURS", "24"))
+PROFILE_SAMPLE_VALUES = 5
+PROFILE_STORED_ROWS = 5
+# Sampled values are cut to this many characters on the source side, so a
+# wide text or bytea column cannot blow up the sample.
+PROFILE_VALUE_CHARS = 200
+
+TABLE_STATS_SQL = """
+SELECT c.oid, c.relkind, c.reltuples::bigint, c.relpages
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = %s AND c.relname = %s
+"""
+
+COLUMN_STATS_SQL = """
+SELECT a.attname, format_type(a.atttypid, a.atttypmod), s.null_frac, s.n_distinct, s.most_common_vals::text
+FROM pg_catalog.pg_attribute a
+LEFT JOIN pg_catalog.pg_stats s
+    ON s.schemaname = %s AND s.tablename = %s AND s.attname = a.attname
+WHERE a.attrelid = %s AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY a.attnum
+"""
+
+def _sample_query(schema: str, table: str, columns: List[str], relkind: str, row_estimate: int, rows: int):
+    """TABLESAMPLE SYSTEM sized to return about `rows` rows; views and small tables just take the first rows"""
+    selected = sql.SQL(", ").join(
+        sql.SQL("left({}::text, {})").format(sql.Identifier(c), sql.Literal(PROFILE_VALUE_CHARS)) for c in columns
+    )
+    source = sql.Identifier(schema, table)
+    if relkind in ("r", "p", "m") and row_estimate > rows * 2:
+        # Page-level sampling reads only the chosen pages; ask for twice the
+        # budget as blocks are uneven, and let the LIMIT cut it back.
+        percent = min(100.0, 200.0 * rows / row_estimate)
+        source = sql.SQL("{} TABLESAMPLE SYSTEM ({})").format(source, sql.Literal(percent))
+    return sql.SQL("SELECT {} FROM {} LIMIT {}").format(selected, source, sql.Literal(rows))
+
+def _distinct_estimate(n_distinct: Optional[float], row_estimate: int) -> Optional[int]:
+    # pg_stats stores large distinct counts as a negative fraction of the rows.
+    if n_distinct is None:
+        return None
+    if n_distinct < 0:
+        return round(-n_distinct * max(row_estimate, 0))
+    return round(n_distinct)
+
+def profile_table(categoryid: int, creds: Dict[str, Any], schema: str, table: str, rows: int = PROFILE_SAMPLE_ROWS, timeout_ms: int = PROFILE_TIMEOUT_MS) -> Dict[str, Any]:
+    """Row estimate and per-column null fraction, distinct estimate and sample values for one source table.
+
+    Counts come from pg_class and pg_stats; the sample is one bounded read
+    under statement_timeout. Columns the source has never analyzed are
+    estimated from the sample instead.
+    """
+    started = datetime.utcnow()
+    with metrics.track("source_db"), sources.registry.connection(categoryid, creds) as conn, conn.cursor() as cur:
+        cur.execute("BEGIN READ ONLY")
+        try:
+            cur.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+            cur.execute(TABLE_STATS_SQL, (schema, table))
+            found = cur.fetchone()
+            if found is None:
+                raise LookupError(f"{schema}.{table} not found")
+            oid, relkind, row_estimate, pages = found
+            cur.execute(COLUMN_STATS_SQL, (schema, table, oid))
+            stats = cur.fetchall()
+            columns = [row[0] for row in stats]
+            sample, sample_error = [], None
+            try:
+                cur.execute(_sample_query(schema, table, columns, relkind, row_estimate, rows))
+                sample = cur.fetchall()
+            except psycopg2.extensions.QueryCanceledError:
+                sample_error = f"sample cancelled after {timeout_ms} ms"
+        finally:
+            cur.execute("ROLLBACK")
+    profile_columns = []
+    for index, (name, column_type, null_frac, n_distinct, common_values) in enumerate(stats):
+        values = [row[index] for row in sample]
+        present = [v for v in values if v is not None]
+        column = {
+            "name": name,
+            "type": column_type,
+            "null_fraction": null_frac,
+            "distinct_estimate": _distinct_estimate(n_distinct, row_estimate),
+            "sample_values": list(dict.fromkeys(present))[:PROFILE_SAMPLE_VALUES],
+            "stats_source": "pg_stats" if null_frac is not None else "sample",
+        }
+        if null_frac is None and values:
+            column["null_fraction"] = round(1 - len(present) / len(values), 4)
+            column["distinct_estimate"] = len(set(present))
+        if common_values is not None:
+            column["most_common_values"] = common_values
+        profile_columns.append(column)
+    return {
+        "schema": schema,
+        "table": table,
+        # reltuples is -1 (Postgres 14+) or 0 for a table that was never analyzed.
+        "row_estimate": row_estimate if row_estimate > 0 else None,
+        "pages": pages,
+        "sampled_rows": len(sample),
+        "sample_error": sample_error,
+        "columns": profile_columns,
+        "rows": [dict(zip(columns, row)) for row in sample[:PROFILE_STORED_ROWS]],
+        "profiled_at": started.isoformat(),
+        "seconds": round((datetime.utcnow() - started).total_seconds(), 4),
+    }
+
+# Shared by all requests, so PROFILE_CONCURRENCY bounds the sampling load on
+# source databases; each category's pool bounds it further per source.
+_executor = ThreadPoolExecutor(max_workers=PROFILE_CONCURRENCY, thread_name_prefix="profile")
+
+def profile_tables(categoryid: int, creds: Dict[str, Any], tables: List[Tuple[str, str]], refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Profiles keyed by "schema.table", computed concurrently; failures are reported per table"""
+    futures = {f"{schema}.{table}": _executor.submit(cached_profile, categoryid, creds, schema, table, refresh) for schema, table in tables}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = {"status": "done", "profile": future.result()}
+        except Exception as exc:
+            results[name] = {"status": "error", "error": f"{exc.__class__.__name__}: {exc}"}
+    return results
+
+def store_profile(session: Session, tableid: int, profile: Dict[str, Any]):
+    """Save a profile, and its first rows as the catalog's samples, next to the catalog"""
+    table = models.CatalogSample.__table__
+    now = datetime.utcnow()
+    values = {"samples": profile["rows"], "profile": {k: v for k, v in profile.items() if k != "rows"}, "profiled_at": now, "date_updated": now}
+    session.execute(insert(table).values(tableid=tableid, **values).on_conflict_do_update(index_elements=[table.c.tableid], set_=values))
+    session.commit()
+    documents.invalidate("catalog", session.info["env"], [tableid])
+
+def stored_profile(sample: Optional[models.CatalogSample], max_age_hours: float = PROFILE_MAX_AGE_HOURS) -> Optional[Dict[str, Any]]:
+    if sample is None or sample.profile is None or sample.profiled_at is None:
+        return None
+    if datetime.utcnow() - sample.profiled_at > timedelta(hours=max_age_hours):
+        return None
+    return {**sample.profile, "rows": sample.samples or []}
+
+def catalog_table_names(schema: str, table: str) -> List[str]:
+    """Names a catalog of schema.table can be stored under, most specific first; catalog_source reads a bare name as public"""
+    names = [f"{schema}.{table}"]
+    if schema == "public":
+        names.append(table)
+    return names
+
+def cached_profile(categoryid: int, creds: Dict[str, Any], schema: str, table: str, refresh: bool = False) -> Dict[str, Any]:
+    """Stored profile of the dev catalog of schema.table while fresh, otherwise a new one (stored when the catalog exists)"""
+    names = catalog_table_names(schema, table)
+    with db.session_factory("dev")() as session:
+        found = dict(session.query(models.Catalog.table_name, models.Catalog.tableid).filter(models.Catalog.table_name.in_(names)))
+        tableid = next((found[name] for name in names if name in found), None)
+        profile = None
+        if tableid is not None and not refresh:
+            profile = stored_profile(session.get(models.CatalogSample, tableid))
+        # Not left idle in a transaction while the source is sampled.
+        session.rollback()
+        if profile is not None:
+            return profile
+        profile = profile_table(categoryid, creds, schema, table)
+        if tableid is not None:
+            store_profile(session, tableid, profile)
+        return profile
+
+def catalog_source(catalog: models.Catalog) -> Tuple[int, str, str]:
+    """(categoryid, schema, table) of a catalog, from its first category mapping and its schema.table name"""
+    categoryid = next((m.categoryid for m in catalog.mappings if m.categoryid is not None), None)
+    if categoryid is None:
+        raise LookupError(f"Catalog {catalog.tableid} is not mapped to a category")
+    schema, _, table = (catalog.table_name or "").rpartition(".")
+    if not table:
+        raise LookupError(f"Catalog {catalog.tableid} has no table name")
+    return categoryid, schema or "public", table
+
+def add_profile_columns(engine):
+    """Add the profile columns to an existing autobi.catalog_sample, creating the table if it is missing"""
+    with engine.begin() as conn:
+        models.CatalogSample.__table__.create(conn, checkfirst=True)
+        conn.execute(text("ALTER TABLE autobi.catalog_sample ADD COLUMN IF NOT EXISTS profile json"))
+        conn.execute(text("ALTER TABLE autobi.catalog_sample ADD COLUMN IF NOT EXISTS profiled_at timestamp"))
@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from . import db, crud, diff, documents, events
+
+PROMOTION_WORKERS = 4
+
+def dependency_tiers(entities: Dict[str, Any]) -> List[List[str]]:
+    """Group entities into tiers so every foreign key points at an earlier tier"""
+    table_to_entity = {model.__table__: name for name, model in entities.items()}
+    depends_on = {
+        name: {table_to_entity[fk.column.table] for fk in model.__table__.foreign_keys
+               if fk.column.table in table_to_entity and fk.column.table is not model.__table__}
+        for name, model in entities.items()
+    }
+    tiers = []
+    while depends_on:
+        ready = [name for name, deps in depends_on.items() if not deps & depends_on.keys()]
+        if not ready:
+            raise ValueError(f"Circular foreign keys between {', '.join(depends_on)}")
+        tiers.append(ready)
+        for name in ready:
+            del depends_on[name]
+    return tiers
+
+def plan_entity(model) -> Dict[str, Any]:
+    start = time.perf_counter()
+    with db.DevSessionLocal() as dev_db, db.ProdSessionLocal() as prod_db:
+        changes = diff.diff_entity(model, dev_db, prod_db)
+    return {
+        "to_insert": changes["added"],
+        "to_update": changes["changed"],
+        "prod_only": len(changes["removed"]),
+        "unchanged": changes["unchanged"],
+        "plan_seconds": round(time.perf_counter() - start, 4),
+    }
+
+def sync_entity(model, plan: Dict[str, Any]) -> Dict[str, Any]:
+    ids = plan["to_insert"] + plan["to_update"]
+    start = time.perf_counter()
+    if ids:
+        with db.DevSessionLocal() as dev_db, db.ProdSessionLocal() as prod_db:
+            results = crud.sync_batch_to_prod(model, dev_db, prod_db, ids)
+        documents.invalidate(model.__tablename__, "prod", ids)
+        events.publish_synced(model, "prod", results)
+    return {"synced": len(ids), "sync_seconds": round(time.perf_counter() - start, 4)}
+
+def _run_entity(model, dry_run: bool) -> Dict[str, Any]:
+    try:
+        report = plan_entity(model)
+        if not dry_run:
+            report.update(sync_entity(model, report))
+        report["status"] = "planned" if dry_run else "synced"
+    except Exception as exc:
+        report = {"status": "error", "error": f"{exc.__class__.__name__}: {exc}"}
+    return report
+
+def promote(entities: Optional[List[str]] = None, dry_run: bool = True, max_workers: int = PROMOTION_WORKERS) -> Dict[str, Any]:
+    """Plan, and unless dry_run, sync dev to prod tier by tier.
+
+    Entities within a tier run concurrently, each with its own sessions and
+    transaction. A failing tier stops the run before any dependent tier.
+    """
+    selected = {name: crud.ENTITY_MODELS[name] for name in (entities or crud.ENTITY_MODELS)}
+    tiers = dependency_tiers(selected)
+    started = time.perf_counter()
+    reports, tier_reports, failed = {}, [], False
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for tier in tiers:
+            if failed:
+                reports.update({name: {"status": "skipped"} for name in tier})
+                tier_reports.append({"entities": tier, "seconds": 0.0})
+                continue
+            tier_start = time.perf_counter()
+            futures = {name: executor.submit(_run_entity, selected[name], dry_run) for name in tier}
+            for name, future in futures.items():
+                reports[name] = future.result()
+                failed = failed or reports[name]["status"] == "error"
+            tier_reports.append({"entities": tier, "seconds": round(time.perf_counter() - tier_start, 4)})
+    return {
+        "dry_run": dry_run,
+        "status": "error" if failed else "success",
+        "tiers": tier_reports,
+        "entities": reports,
+        "total_seconds": round(time.perf_counter() - started, 4),
+    }
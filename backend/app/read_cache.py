@@ -0,0 +1,213 @@
+import logging
+import os
+import select
+import threading
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+import psycopg2
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from . import db, metrics, models
+from .cache import SizedLRUCache
+
+READ_CACHE_ENABLED = os.getenv("READ_CACHE_ENABLED", "true").lower() == "true"
+READ_CACHE_MAX_BYTES = int(os.getenv("READ_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+READ_CACHE_TTL = float(os.getenv("READ_CACHE_TTL", "600"))
+LISTEN_POLL_SECONDS = 5.0
+LISTEN_RETRY_SECONDS = float(os.getenv("CACHE_LISTEN_RETRY_SECONDS", "5"))
+MISSING_TRIGGERS_RETRY_SECONDS = 60.0
+
+logger = logging.getLogger("autobi.read_cache")
+
+def estimate_size(value: Any) -> int:
+    """Rough bytes held by a cached value: string and bytes lengths plus a fixed cost per object"""
+    if isinstance(value, (str, bytes)):
+        return 50 + len(value)
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(v) for v in value)
+    if isinstance(value, (datetime, date)):
+        return 48
+    return 32
+
+# Keys are (env, tables, kind, ...): tables lists every table the value was
+# read from, so a write to any of them drops it.
+cache = SizedLRUCache(READ_CACHE_MAX_BYTES, READ_CACHE_TTL, estimate_size)
+
+_MISSING = object()
+_generations: Dict[Tuple[str, str], int] = {}
+_generations_lock = threading.Lock()
+
+def _generation(env: str, tables: Iterable[str]) -> Tuple[int, ...]:
+    with _generations_lock:
+        return tuple(_generations.get((env, table), 0) for table in tables)
+
+def invalidate(env: str, tables: Iterable[str]) -> int:
+    tables = set(tables)
+    with _generations_lock:
+        for table in tables:
+            _generations[(env, table)] = _generations.get((env, table), 0) + 1
+    return cache.invalidate(lambda key: key[0] == env and not tables.isdisjoint(key[1]))
+
+def invalidate_where(env: Optional[str], predicate: Callable[[Hashable], bool]) -> int:
+    """Drop entries of env (all environments when None) that match predicate"""
+    return cache.invalidate(lambda key: (env is None or key[0] == env) and predicate(key))
+
+def cached(env: Optional[str], tables: Tuple[str, ...], key: tuple, loader: Callable[[], Any]) -> Any:
+    """Read-through lookup for a value built from tables in env.
+
+    Values are only cached while env's change listener is connected, so every
+    write in any worker reaches this cache. A value whose tables changed while
+    it was being loaded is returned but not stored.
+    """
+    if env is None or not _listening(env):
+        return loader()
+    full_key = (env, tables) + key
+    value = cache.get(full_key, _MISSING)
+    if value is not _MISSING:
+        metrics.inc("autobi_cache_lookups_total", kind=key[0], result="hit")
+        return value
+    metrics.inc("autobi_cache_lookups_total", kind=key[0], result="miss")
+    generation = _generation(env, tables)
+    value = loader()
+    if value is not None and _generation(env, tables) == generation:
+        cache.set(full_key, value)
+    return value
+
+class ChangeListener(threading.Thread):
+    """LISTENs for cache notifications from one environment and drops what they name.
+
+    Runs on its own connection outside the pool. After any reconnect the
+    environment's entries are dropped, since notifications sent while it was
+    away are lost.
+    """
+
+    def __init__(self, env: str):
+        super().__init__(name=f"cache-listener-{env}", daemon=True)
+        self.env = env
+        self.connected = False
+        self.notifications = 0
+        self.reconnects = 0
+        self.missing_triggers = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(db.ENVIRONMENTS[self.env].url, application_name="autobi-cache-listener")
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("SELECT count(*) FROM pg_trigger WHERE tgname = ANY(%s)", ([f"{t}_notify_cache" for t in models.CACHE_NOTIFY_MODELS],))
+                    if cur.fetchone()[0] < len(models.CACHE_NOTIFY_MODELS):
+                        # Without the triggers other workers' writes go unnoticed, so this environment is not cached.
+                        self.missing_triggers = True
+                        logger.warning("Cache notify triggers are missing in %s; run read_cache.install_notify_triggers", self.env)
+                        self._stop_event.wait(MISSING_TRIGGERS_RETRY_SECONDS)
+                        continue
+                    self.missing_triggers = False
+                    cur.execute(f"LISTEN {models.CACHE_NOTIFY_CHANNEL}")
+                invalidate(self.env, models.CACHE_NOTIFY_MODELS)
+                self.connected = True
+                self._listen(conn)
+            except Exception:
+                # Any failure means notifications may have been missed; the reconnect drops the entries.
+                logger.warning("Cache listener for %s failed; retrying in %ss", self.env, LISTEN_RETRY_SECONDS, exc_info=True)
+            finally:
+                if self.connected:
+                    self.reconnects += 1
+                self.connected = False
+                if conn is not None:
+                    conn.close()
+            self._stop_event.wait(LISTEN_RETRY_SECONDS)
+
+    def _listen(self, conn):
+        while not self._stop_event.is_set():
+            if select.select([conn], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                # Idle: a cheap round trip notices a dead connection.
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                continue
+            conn.poll()
+            tables = {notify.payload for notify in conn.notifies}
+            conn.notifies.clear()
+            if tables:
+                self.notifications += len(tables)
+                invalidate(self.env, tables)
+
+    def stop(self):
+        self._stop_event.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+_listeners: Dict[str, ChangeListener] = {}
+_listeners_lock = threading.Lock()
+
+def _listening(env: str) -> bool:
+    """True once env's listener is connected.
+
+    Starts the listener on first use, so idle environments stay unconnected,
+    and again if its thread died; reads stay uncached until it connects.
+    """
+    if not READ_CACHE_ENABLED:
+        return False
+    listener = _listeners.get(env)
+    if listener is None or not listener.is_alive():
+        with _listeners_lock:
+            listener = _listeners.get(env)
+            if listener is not None and listener.stopped:
+                return False
+            if listener is None or not listener.is_alive():
+                if listener is not None:
+                    logger.warning("Cache listener for %s died; starting a new one", env)
+                listener = _listeners[env] = ChangeListener(env)
+                listener.start()
+    return listener.connected
+
+def stop_listeners():
+    with _listeners_lock:
+        for listener in _listeners.values():
+            listener.stop()
+
+# Writes through a session invalidate this worker's cache as soon as they
+# commit; other workers hear about them from the notify triggers.
+@event.listens_for(Session, "do_orm_execute")
+def _record_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            orm_execute_state.session.info.setdefault("written_tables", set()).add(table.name)
+
+@event.listens_for(Session, "after_flush")
+def _record_flush(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        session.info.setdefault("written_tables", set()).add(instance.__table__.name)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    tables = session.info.pop("written_tables", None)
+    if tables and "env" in session.info:
+        invalidate(session.info["env"], tables)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("written_tables", None)
+
+def install_notify_triggers(engine):
+    """Install the notify triggers on an existing database"""
+    with engine.begin() as conn:
+        for statement in models.cache_notify_ddl():
+            conn.execute(text(statement))
+
+def stats() -> Dict[str, Any]:
+    return {
+        "enabled": READ_CACHE_ENABLED,
+        **cache.stats(),
+        "listeners": {
+            env: {"connected": listener.connected, "missing_triggers": listener.missing_triggers, "notifications": listener.notifications, "reconnects": listener.reconnects}
+            for env, listener in _listeners.items()
+        },
+    }
@@ -0,0 +1,177 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from sqlalchemy import select, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from . import db, crud, models, documents, promotion, events
+
+REPLICATION_BATCH_SIZE = int(os.getenv("REPLICATION_BATCH_SIZE", "1000"))
+# Audit rows are stamped with their transaction's start time, so an entry is
+# only replayed once it is older than the longest expected dev transaction;
+# newer ones could still be joined by lower audit ids that have not committed.
+REPLICATION_LAG_SECONDS = float(os.getenv("REPLICATION_LAG_SECONDS", "30"))
+# Serializes replication runs across workers; the value is arbitrary.
+REPLICATION_LOCK_KEY = 4161063
+
+logger = logging.getLogger("autobi.replication")
+
+def replication_order(entities: Optional[List[str]] = None) -> List[str]:
+    selected = {name: crud.ENTITY_MODELS[name] for name in (entities or crud.ENTITY_MODELS)}
+    return [name for tier in promotion.dependency_tiers(selected) for name in tier]
+
+def load_watermarks(prod_db: Session, table_names: List[str]) -> Dict[str, Dict[str, Any]]:
+    table = models.ReplicationWatermark.__table__
+    prod_db.execute(insert(table).values([{"table_name": t, "last_audit_id": 0} for t in table_names]).on_conflict_do_nothing())
+    rows = prod_db.execute(select(table).where(table.c.table_name.in_(table_names))).mappings()
+    return {row["table_name"]: dict(row) for row in rows}
+
+def clear_dependents(model, ids: List[int], prod_db: Session) -> int:
+    """Release rows of non-entity tables (catalog_mapping, catalog_sample) that reference ids of model.
+
+    They are not replicated, so nothing else removes them before the parent
+    delete. Rows that cannot exist without the parent are deleted; nullable
+    references are set to NULL. Returns the number of rows touched.
+    """
+    entity_tables = {m.__table__ for m in crud.ENTITY_MODELS.values()}
+    touched = 0
+    for table in models.Base.metadata.sorted_tables:
+        if table in entity_tables:
+            continue
+        for fk in table.foreign_keys:
+            if fk.column.table is not model.__table__:
+                continue
+            column = fk.parent
+            if column.nullable and not column.primary_key:
+                stmt = table.update().where(column.in_(ids)).values({column.name: None})
+            else:
+                stmt = table.delete().where(column.in_(ids))
+            touched += prod_db.execute(stmt).rowcount
+    return touched
+
+def read_changes(dev_db: Session, table_name: str, watermark: Dict[str, Any], batch_size: int):
+    """Next batch of audit entries after the watermark, oldest first, cut before the first one younger than the lag.
+
+    Entries are stamped when written, so a lower audit_id that is not visible
+    yet was written after the cut too; one written before it belongs to a
+    transaction that has committed, given transactions finish within the lag.
+    """
+    audit = models.TableAudit.__table__
+    cutoff = dev_db.execute(select(func.localtimestamp() - timedelta(seconds=REPLICATION_LAG_SECONDS))).scalar()
+    stmt = select(audit.c.audit_id, audit.c.record_id, audit.c.changed_at).where(
+        audit.c.table_name == table_name,
+        audit.c.audit_id > watermark["last_audit_id"],
+    )
+    if watermark["last_changed_at"] is not None:
+        # Lets Postgres skip audit partitions that were fully replayed.
+        stmt = stmt.where(audit.c.changed_at >= watermark["last_changed_at"] - timedelta(seconds=REPLICATION_LAG_SECONDS))
+    changes = dev_db.execute(stmt.order_by(audit.c.audit_id).limit(batch_size)).all()
+    # Filtering on the cutoff instead could skip a young entry and move the
+    # watermark past it.
+    for index, change in enumerate(changes):
+        if change.changed_at >= cutoff:
+            return changes[:index]
+    return changes
+
+def replicate_batch(order: List[str], dev_db: Session, prod_db: Session, batch_size: int, report: Dict[str, Dict[str, Any]]) -> bool:
+    """Replay one batch per table in a single prod transaction; True while any table has more"""
+    prod_db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": REPLICATION_LOCK_KEY})
+    models_by_name = {name: crud.ENTITY_MODELS[name] for name in order}
+    watermarks = load_watermarks(prod_db, [m.__tablename__ for m in models_by_name.values()])
+    plans, more = {}, False
+    for name, model in models_by_name.items():
+        changes = read_changes(dev_db, model.__tablename__, watermarks[model.__tablename__], batch_size)
+        if not changes:
+            continue
+        more = more or len(changes) == batch_size
+        # Only the current dev row matters, however many entries a record has.
+        ids = list(dict.fromkeys(change.record_id for change in changes))
+        rows = crud.get_rows_for_sync(dev_db, model, ids)
+        present = {row[crud.primary_key_column(model).name] for row in rows}
+        plans[name] = {"rows": rows, "gone": [i for i in ids if i not in present], "first": changes[0], "last": changes[-1]}
+    dev_db.rollback()
+    if not plans:
+        return False
+    watermark_table = models.ReplicationWatermark.__table__
+    touched, cleared = {}, {}
+    try:
+        for name in order:
+            if name in plans:
+                touched[name] = list(crud.upsert_rows(models_by_name[name], plans[name]["rows"], prod_db))
+        # Deletes run children first so foreign keys in prod never dangle.
+        for name in reversed(order):
+            if name in plans and plans[name]["gone"]:
+                cleared[name] = clear_dependents(models_by_name[name], plans[name]["gone"], prod_db)
+                deleted = crud.delete_rows(models_by_name[name], plans[name]["gone"], prod_db)
+                touched[name] = touched.get(name, []) + deleted
+                plans[name]["deleted"] = len(deleted)
+        for name, plan in plans.items():
+            prod_db.execute(watermark_table.update().where(watermark_table.c.table_name == models_by_name[name].__tablename__).values(
+                last_audit_id=plan["last"].audit_id, last_changed_at=plan["last"].changed_at, date_updated=datetime.utcnow(),
+            ))
+        prod_db.commit()
+    except Exception as exc:
+        prod_db.rollback()
+        # The watermarks stay put, so the next run retries this same batch.
+        for name, plan in plans.items():
+            report[name]["failed"] = {
+                "from_audit_id": plan["first"].audit_id, "to_audit_id": plan["last"].audit_id,
+                "records": len(plan["rows"]) + len(plan["gone"]), "error": f"{exc.__class__.__name__}: {exc}",
+            }
+        logger.error("Replication batch failed for %s", ", ".join(plans), exc_info=True)
+        raise
+    for name, ids in touched.items():
+        documents.invalidate(models_by_name[name].__tablename__, "prod", ids)
+    for name, plan in plans.items():
+        report[name]["upserted"] += len(plan["rows"])
+        report[name]["deleted"] += plan.get("deleted", 0)
+        report[name]["dependents_cleared"] += cleared.get(name, 0)
+        report[name]["last_audit_id"] = plan["last"].audit_id
+        events.publish_rows(models_by_name[name], "prod", "synced", plan["rows"])
+        for record_id in plan["gone"]:
+            events.broker.publish(name, record_id, "prod", "deleted")
+    return more
+
+def replicate(entities: Optional[List[str]] = None, batch_size: int = REPLICATION_BATCH_SIZE, max_batches: Optional[int] = None) -> Dict[str, Any]:
+    """Replay dev audit entries past each table's watermark into prod.
+
+    Every batch upserts the current dev row of each touched record, deletes
+    records that no longer exist in dev, and advances the watermarks, all in
+    one prod transaction. Cost follows the number of changes, not table size.
+    """
+    order = replication_order(entities)
+    report = {name: {"upserted": 0, "deleted": 0, "dependents_cleared": 0, "last_audit_id": None, "failed": None} for name in order}
+    started, batches, status, error = time.perf_counter(), 0, "success", None
+    models.ReplicationWatermark.__table__.create(db.prod_engine, checkfirst=True)
+    with db.DevSessionLocal() as dev_db, db.ProdSessionLocal() as prod_db:
+        try:
+            while max_batches is None or batches < max_batches:
+                batches += 1
+                if not replicate_batch(order, dev_db, prod_db, batch_size, report):
+                    break
+        except Exception as exc:
+            # Earlier batches stay committed; their watermarks already moved.
+            status, error = "error", f"{exc.__class__.__name__}: {exc}"
+    result = {"status": status, "batches": batches, "entities": report, "total_seconds": round(time.perf_counter() - started, 4)}
+    if error:
+        result["error"] = error
+    return result
+
+def replication_status(entities: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Watermark and count of dev audit entries not yet replayed, per entity"""
+    order = replication_order(entities)
+    models.ReplicationWatermark.__table__.create(db.prod_engine, checkfirst=True)
+    audit = models.TableAudit.__table__
+    status = {}
+    with db.DevSessionLocal() as dev_db, db.ProdSessionLocal() as prod_db:
+        watermarks = load_watermarks(prod_db, [crud.ENTITY_MODELS[name].__tablename__ for name in order])
+        prod_db.commit()
+        for name in order:
+            watermark = watermarks[crud.ENTITY_MODELS[name].__tablename__]
+            pending = dev_db.execute(select(func.count()).select_from(audit).where(
+                audit.c.table_name == watermark["table_name"], audit.c.audit_id > watermark["last_audit_id"],
+            )).scalar()
+            status[name] = {**watermark, "pending": pending}
+    return status
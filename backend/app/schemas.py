@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, Any
+from pydantic import BaseModel, Field
+from typing import Optional, Any, List
 from datetime import datetime
 
 class SystemBase(BaseModel):
@@ -96,4 +96,51 @@ class TableAudit(TableAuditBase):
     audit_id: int
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+class SyncBatchRequest(BaseModel):
+    ids: Optional[List[int]] = None
+    updated_since: Optional[datetime] = None
+    all: bool = False
+
+class SyncResult(BaseModel):
+    id: int
+    status: str
+
+class SyncBatchResponse(BaseModel):
+    status: str
+    results: List[SyncResult]
+
+class PromotionRequest(BaseModel):
+    entities: Optional[List[str]] = None
+    dry_run: bool = True
+
+class ReplicationRequest(BaseModel):
+    entities: Optional[List[str]] = None
+    batch_size: int = Field(1000, ge=1, le=10000)
+    max_batches: Optional[int] = Field(None, ge=1)
+
+class CategoryIdRequest(BaseModel):
+    categoryid: int
+
+class SchemaRequest(CategoryIdRequest):
+    schema_name: str = Field(alias="schema")
+
+class SchemaTreeRequest(CategoryIdRequest):
+    schema_name: Optional[str] = Field(None, alias="schema")
+
+class MetadataRequest(SchemaRequest):
+    table: str
+
+class MetadataJobRequest(CategoryIdRequest):
+    schema_name: Optional[str] = Field(None, alias="schema")
+    tables: Optional[List[str]] = None
+
+class ProfileRequest(CategoryIdRequest):
+    schema_name: Optional[str] = Field(None, alias="schema")
+    tables: Optional[List[str]] = Field(None, max_length=200)
+    refresh: bool = False
+
+class LatestHistoryRequest(BaseModel):
+    record_ids: List[int] = Field(..., max_length=1000)
+    limit: int = Field(10, ge=1, le=100)
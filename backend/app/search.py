@@ -0,0 +1,54 @@
+from typing import Dict, Any, List
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from . import models
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_HEADLINE_OPTIONS = "MaxFragments=1, MaxWords=20, MinWords=5"
+
+# table -> (model, search document, result columns, description column)
+SEARCH_TARGETS = {
+    "catalog": (models.Catalog, models.CATALOG_SEARCH_DOCUMENT, ["tableid", "table_vector_id", "table_name"], "table_description"),
+    "context": (models.Context, models.CONTEXT_SEARCH_DOCUMENT, ["contextid", "context_vector_id", "context_name"], "context_description"),
+}
+
+def search(db: Session, table_name: str, query: str, limit: int = SEARCH_DEFAULT_LIMIT) -> List[Dict[str, Any]]:
+    """Top-k rows matching a web-style query ("quoted phrases", or, -exclusions), best first.
+
+    Matching and ranking run on the GIN-indexed search document, so results
+    reflect every committed insert, update and sync without a rebuild step.
+    The query is parsed both unstemmed, for names and ids, and with English
+    stemming, for descriptions.
+    """
+    model, document, columns, description = SEARCH_TARGETS[table_name]
+    table = model.__table__
+    pk = columns[0]
+    selected = ", ".join(f"t.{c}" for c in columns)
+    sql = f"""
+        WITH query AS (
+            SELECT websearch_to_tsquery('simple', :query) || websearch_to_tsquery('english', :query) AS q
+        ),
+        hits AS (
+            SELECT {selected}, t.{description} AS description, ts_rank_cd({document}, query.q) AS rank
+            FROM {table.schema}.{table.name} t, query
+            WHERE {document} @@ query.q
+            ORDER BY rank DESC, t.{pk}
+            LIMIT :limit
+        )
+        SELECT {", ".join(f"hits.{c}" for c in columns)}, hits.rank,
+               ts_headline('english', coalesce(hits.description, ''), query.q, '{SEARCH_HEADLINE_OPTIONS}') AS snippet
+        FROM hits, query
+        ORDER BY hits.rank DESC, hits.{pk}
+    """
+    return [dict(row) for row in db.execute(text(sql), {"query": query, "limit": limit}).mappings()]
+
+def create_indexes(engine) -> List[str]:
+    """Build the search indexes on an existing database, skipping any that exist"""
+    created = []
+    for model, *_ in SEARCH_TARGETS.values():
+        for index in model.__table__.indexes:
+            if index.name.endswith("_search"):
+                index.create(engine, checkfirst=True)
+                created.append(index.name)
+    return created
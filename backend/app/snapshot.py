@@ -0,0 +1,174 @@
+"""Export and import consistent snapshots of the autobi tables with COPY.
+
+    poetry run python -m app.snapshot export --env prod --out snapshots/prod-2024-06-01 --format jsonl
+    poetry run python -m app.snapshot import --env qa --from snapshots/prod-2024-06-01
+
+Export reads every table inside one REPEATABLE READ transaction and streams
+COPY TO STDOUT straight into gzip files, plus a manifest.json. Import streams
+each file through COPY FROM STDIN into a temporary staging table, then merges
+it with a single INSERT ... ON CONFLICT DO UPDATE, all in one transaction.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from sqlalchemy import Integer
+from . import db, models
+
+SNAPSHOT_FORMATS = ("csv", "jsonl")
+# JSONL is written by COPY in CSV mode with quote and delimiter characters
+# that never occur in row_to_json output, so lines come out unquoted and
+# unescaped; text mode would double every backslash.
+JSONL_COPY_OPTIONS = "FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02'"
+
+def snapshot_tables(names: Optional[List[str]] = None):
+    """autobi tables in foreign-key order"""
+    tables = [t for t in models.Base.metadata.sorted_tables if t.schema == "autobi"]
+    if names:
+        unknown = set(names) - {t.name for t in tables}
+        if unknown:
+            raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+        tables = [t for t in tables if t.name in names]
+    return tables
+
+def _quoted(names: List[str]) -> str:
+    return ", ".join(f'"{name}"' for name in names)
+
+def _existing(cur, table) -> bool:
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f"{table.schema}.{table.name}",))
+    return cur.fetchone()[0]
+
+def export_snapshot(env: str, out_dir: str, fmt: str = "csv", names: Optional[List[str]] = None) -> Dict[str, Any]:
+    if fmt not in SNAPSHOT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(SNAPSHOT_FORMATS)}")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"env": env, "format": fmt, "tables": []}
+    conn = db.get_engine(env).raw_connection()
+    try:
+        # The pool's pre-ping may have opened a transaction already.
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cur.execute("SELECT now()")
+            manifest["snapshot_at"] = cur.fetchone()[0].isoformat()
+            for table in snapshot_tables(names):
+                if not _existing(cur, table):
+                    continue
+                columns = [c.name for c in table.columns]
+                order = _quoted([c.name for c in table.primary_key.columns])
+                query = f"SELECT {_quoted(columns)} FROM {table.schema}.{table.name} ORDER BY {order}"
+                if fmt == "jsonl":
+                    sql = f"COPY (SELECT row_to_json(t) FROM ({query}) t) TO STDOUT WITH ({JSONL_COPY_OPTIONS})"
+                else:
+                    sql = f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+                file_name = f"{table.name}.{fmt}.gz"
+                started = time.perf_counter()
+                with gzip.open(os.path.join(out_dir, file_name), "wb", compresslevel=6) as f:
+                    cur.copy_expert(sql, f)
+                seconds = time.perf_counter() - started
+                manifest["tables"].append({
+                    "table": table.name, "file": file_name, "columns": columns, "rows": cur.rowcount,
+                    "bytes": os.path.getsize(os.path.join(out_dir, file_name)), "seconds": round(seconds, 3),
+                    "rows_per_second": round(cur.rowcount / seconds) if seconds else None,
+                })
+        conn.rollback()
+    finally:
+        conn.close()
+    manifest["exported_at"] = datetime.utcnow().isoformat()
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def _merge_sql(table, columns: List[str], source: str) -> str:
+    pks = [c.name for c in table.primary_key.columns]
+    updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in columns if c not in pks)
+    action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+    return (
+        f"INSERT INTO {table.schema}.{table.name} ({_quoted(columns)}) SELECT {_quoted(columns)} FROM {source} "
+        f"ON CONFLICT ({_quoted(pks)}) {action}"
+    )
+
+def _reset_sequences(cur, table):
+    for column in table.primary_key.columns:
+        if isinstance(column.type, Integer):
+            cur.execute(
+                f'SELECT setval(pg_get_serial_sequence(%s, %s), coalesce(max("{column.name}"), 0) + 1, false) FROM {table.schema}.{table.name}',
+                (f"{table.schema}.{table.name}", column.name),
+            )
+
+def import_snapshot(env: str, in_dir: str, names: Optional[List[str]] = None, disable_triggers: bool = False) -> Dict[str, Any]:
+    """Merge a snapshot into env in one transaction; returns rows merged per table"""
+    with open(os.path.join(in_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    entries = {entry["table"]: entry for entry in manifest["tables"]}
+    fmt = manifest["format"]
+    report = {"env": env, "source_env": manifest["env"], "snapshot_at": manifest.get("snapshot_at"), "tables": []}
+    conn = db.get_engine(env).raw_connection()
+    try:
+        with conn.cursor() as cur:
+            if disable_triggers:
+                # Skips the audit triggers for a restore; needs superuser rights.
+                cur.execute("SET LOCAL session_replication_role = replica")
+            for table in snapshot_tables(names):
+                entry = entries.get(table.name)
+                if entry is None:
+                    continue
+                missing = set(entry["columns"]) - {c.name for c in table.columns}
+                if missing:
+                    raise ValueError(f"{table.name}: snapshot columns not in the model: {', '.join(sorted(missing))}")
+                columns, staging = entry["columns"], f"snapshot_{table.name}"
+                started = time.perf_counter()
+                if fmt == "jsonl":
+                    cur.execute(f"CREATE TEMP TABLE {staging} (doc jsonb) ON COMMIT DROP")
+                    copy_sql = f"COPY {staging} (doc) FROM STDIN WITH ({JSONL_COPY_OPTIONS})"
+                    source = f"(SELECT r.* FROM {staging}, jsonb_populate_record(NULL::{table.schema}.{table.name}, doc) r) s"
+                else:
+                    cur.execute(f"CREATE TEMP TABLE {staging} (LIKE {table.schema}.{table.name}) ON COMMIT DROP")
+                    copy_sql = f"COPY {staging} ({_quoted(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)"
+                    source = staging
+                with gzip.open(os.path.join(in_dir, entry["file"]), "rb") as f:
+                    cur.copy_expert(copy_sql, f)
+                loaded = cur.rowcount
+                cur.execute(_merge_sql(table, columns, source))
+                merged = cur.rowcount
+                _reset_sequences(cur, table)
+                seconds = time.perf_counter() - started
+                report["tables"].append({
+                    "table": table.name, "loaded": loaded, "merged": merged, "seconds": round(seconds, 3),
+                    "rows_per_second": round(loaded / seconds) if seconds else None,
+                })
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write a snapshot of one environment")
+    export_parser.add_argument("--env", required=True, choices=db.DB_ENVIRONMENTS)
+    export_parser.add_argument("--out", required=True, help="directory for the gzip files and manifest.json")
+    export_parser.add_argument("--format", choices=SNAPSHOT_FORMATS, default="csv")
+    export_parser.add_argument("--tables", nargs="+", help="only these tables (default: all autobi tables)")
+    import_parser = commands.add_parser("import", help="merge a snapshot into one environment")
+    import_parser.add_argument("--env", required=True, choices=db.DB_ENVIRONMENTS)
+    import_parser.add_argument("--from", dest="in_dir", required=True, help="directory holding manifest.json")
+    import_parser.add_argument("--tables", nargs="+", help="only these tables (default: all in the manifest)")
+    import_parser.add_argument("--disable-triggers", action="store_true", help="do not write audit entries for merged rows (superuser only)")
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        report = export_snapshot(args.env, args.out, args.format, args.tables)
+    else:
+        report = import_snapshot(args.env, args.in_dir, args.tables, args.disable_triggers)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
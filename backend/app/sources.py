@@ -0,0 +1,229 @@
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from . import metrics
+from .cache import TTLCache
+
+SOURCE_POOL_MAX_CATEGORIES = int(os.getenv("SOURCE_POOL_MAX_CATEGORIES", "16"))
+SOURCE_POOL_MAX_CONNECTIONS = int(os.getenv("SOURCE_POOL_MAX_CONNECTIONS", "4"))
+SOURCE_POOL_IDLE_SECONDS = float(os.getenv("SOURCE_POOL_IDLE_SECONDS", "300"))
+SOURCE_POOL_CHECKOUT_TIMEOUT = float(os.getenv("SOURCE_POOL_CHECKOUT_TIMEOUT", "30"))
+SOURCE_HEALTHCHECK_SECONDS = float(os.getenv("SOURCE_HEALTHCHECK_SECONDS", "30"))
+SOURCE_CONNECT_TIMEOUT = int(os.getenv("SOURCE_CONNECT_TIMEOUT", "10"))
+INTROSPECTION_CACHE_TTL = float(os.getenv("INTROSPECTION_CACHE_TTL", "600"))
+INTROSPECTION_CACHE_SIZE = int(os.getenv("INTROSPECTION_CACHE_SIZE", "512"))
+
+@lru_cache(maxsize=256)
+def _decode_preferences(raw: str) -> Tuple[str, Dict[str, Any]]:
+    prefs = json.loads(raw)
+    creds = json.loads(base64.b64decode(prefs["credentials"]).decode()) if prefs.get("credentials") else {}
+    return prefs["db_type"], creds
+
+def decode_preferences(category_preferences) -> Tuple[str, Dict[str, Any]]:
+    """Return (db_type, credentials) for a category, decoding each distinct value only once"""
+    if not isinstance(category_preferences, str):
+        category_preferences = json.dumps(category_preferences, sort_keys=True)
+    return _decode_preferences(category_preferences)
+
+class _KeepAlivePool(ThreadedConnectionPool):
+    """Opens connections on demand, but keeps up to maxconn of them idle.
+
+    ThreadedConnectionPool only keeps minconn idle connections and closes
+    the rest on putconn, while a minconn above zero is opened up front.
+    """
+
+    def __init__(self, maxconn: int, **kwargs):
+        super().__init__(0, maxconn, **kwargs)
+        self.minconn = maxconn
+
+class _SourcePool:
+    def __init__(self, creds: Dict[str, Any], max_connections: int):
+        self.pool = _KeepAlivePool(
+            max_connections,
+            database=creds["database"], user=creds["user"], password=creds["password"],
+            host=creds["host"], port=creds["port"],
+            connect_timeout=SOURCE_CONNECT_TIMEOUT, application_name="autobi-migrator",
+        )
+        # ThreadedConnectionPool raises instead of waiting when exhausted.
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.returned_at = {}
+
+class SourcePoolRegistry:
+    """Bounded per-category connection pools, evicting the least recently used idle pool"""
+
+    def __init__(self, max_pools: int = SOURCE_POOL_MAX_CATEGORIES, max_connections: int = SOURCE_POOL_MAX_CONNECTIONS, idle_seconds: float = SOURCE_POOL_IDLE_SECONDS):
+        self.max_pools = max_pools
+        self.max_connections = max_connections
+        self.idle_seconds = idle_seconds
+        self._pools: "OrderedDict[tuple, _SourcePool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(categoryid: int, creds: Dict[str, Any]) -> tuple:
+        # Credentials are part of the key so edited preferences get a fresh pool.
+        return (categoryid, creds.get("host"), str(creds.get("port")), creds.get("database"), creds.get("user"), hash(creds.get("password")))
+
+    def _close(self, key: tuple):
+        self._pools.pop(key).pool.closeall()
+
+    def _evict(self):
+        now = time.monotonic()
+        for key, entry in list(self._pools.items()):
+            if entry.in_use == 0 and now - entry.last_used > self.idle_seconds:
+                self._close(key)
+        idle = [key for key, entry in self._pools.items() if entry.in_use == 0]
+        while len(self._pools) > self.max_pools and idle:
+            self._close(idle.pop(0))
+
+    def _acquire_pool(self, categoryid: int, creds: Dict[str, Any]) -> _SourcePool:
+        key = self._key(categoryid, creds)
+        with self._lock:
+            entry = self._pools.get(key)
+            if entry is None:
+                entry = self._pools[key] = _SourcePool(creds, self.max_connections)
+            self._pools.move_to_end(key)
+            entry.in_use += 1
+            entry.last_used = time.monotonic()
+            self._evict()
+        return entry
+
+    def _release_pool(self, entry: _SourcePool):
+        with self._lock:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+    @staticmethod
+    def _healthy(entry: _SourcePool, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - entry.returned_at.get(id(conn), 0) < SOURCE_HEALTHCHECK_SECONDS:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self, entry: _SourcePool):
+        """A pooled autocommit connection; one failing its health check is replaced once"""
+        for attempt in range(2):
+            conn = entry.pool.getconn()
+            try:
+                # Autocommit before the health check, which would otherwise
+                # leave a transaction open and make set_session fail.
+                if not conn.closed:
+                    conn.autocommit = True
+                if attempt or self._healthy(entry, conn):
+                    return conn
+            except BaseException:
+                entry.pool.putconn(conn, close=True)
+                raise
+            entry.pool.putconn(conn, close=True)
+
+    @contextmanager
+    def connection(self, categoryid: int, creds: Dict[str, Any]):
+        """Check out a warm autocommit connection to the category's source database"""
+        entry = self._acquire_pool(categoryid, creds)
+        try:
+            if not entry.slots.acquire(timeout=SOURCE_POOL_CHECKOUT_TIMEOUT):
+                raise TimeoutError(f"No free source connection for category {categoryid}")
+            try:
+                conn = self._checkout(entry)
+                broken = False
+                try:
+                    yield conn
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    broken = True
+                    raise
+                finally:
+                    entry.returned_at[id(conn)] = time.monotonic()
+                    entry.pool.putconn(conn, close=broken or conn.closed)
+            finally:
+                entry.slots.release()
+        finally:
+            self._release_pool(entry)
+
+    def stats(self):
+        with self._lock:
+            return [
+                {"categoryid": key[0], "in_use": entry.in_use, "idle_seconds": round(time.monotonic() - entry.last_used, 1)}
+                for key, entry in self._pools.items()
+            ]
+
+    def close_all(self):
+        with self._lock:
+            for key in list(self._pools):
+                self._close(key)
+
+registry = SourcePoolRegistry()
+
+# Keys are (categoryid, kind, schema); schema is None for category-wide results.
+introspection_cache = TTLCache(INTROSPECTION_CACHE_SIZE, INTROSPECTION_CACHE_TTL)
+
+SCHEMA_TREE_SQL = """
+SELECT n.nspname, c.relname, c.relkind, a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull
+FROM pg_catalog.pg_namespace n
+LEFT JOIN pg_catalog.pg_class c
+    ON c.relnamespace = n.oid AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+LEFT JOIN pg_catalog.pg_attribute a
+    ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+WHERE n.nspname NOT IN ('pg_catalog', 'information_schema')
+  AND n.nspname NOT LIKE 'pg\\_toast%%'
+  AND n.nspname NOT LIKE 'pg\\_temp\\_%%'
+  AND has_schema_privilege(n.oid, 'USAGE')
+  AND (%(schema)s IS NULL OR n.nspname = %(schema)s)
+ORDER BY n.nspname, c.relname, a.attnum
+"""
+
+RELKINDS = {"r": "table", "p": "partitioned table", "v": "view", "m": "materialized view", "f": "foreign table"}
+
+def _fetch_schemas(categoryid: int, creds: Dict[str, Any]):
+    with metrics.track("source_db"), registry.connection(categoryid, creds) as conn, conn.cursor() as cur:
+        cur.execute("SELECT schema_name FROM information_schema.schemata;")
+        return [row[0] for row in cur.fetchall()]
+
+def _fetch_tables(categoryid: int, creds: Dict[str, Any], schema: str):
+    with metrics.track("source_db"), registry.connection(categoryid, creds) as conn, conn.cursor() as cur:
+        cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = %s;", (schema,))
+        return [row[0] for row in cur.fetchall()]
+
+def _fetch_schema_tree(categoryid: int, creds: Dict[str, Any], schema: Optional[str]):
+    with metrics.track("source_db"), registry.connection(categoryid, creds) as conn, conn.cursor() as cur:
+        cur.execute(SCHEMA_TREE_SQL, {"schema": schema})
+        rows = cur.fetchall()
+    tree = OrderedDict()
+    for schema_name, table_name, relkind, column_name, column_type, not_null in rows:
+        tables = tree.setdefault(schema_name, OrderedDict())
+        if table_name is None:
+            continue
+        table = tables.setdefault(table_name, {"name": table_name, "kind": RELKINDS[relkind], "columns": []})
+        if column_name is not None:
+            table["columns"].append({"name": column_name, "type": column_type, "nullable": not not_null})
+    return [{"schema": name, "tables": list(tables.values())} for name, tables in tree.items()]
+
+def list_schemas(categoryid: int, creds: Dict[str, Any]):
+    return introspection_cache.get_or_load((categoryid, "schemas", None), lambda: _fetch_schemas(categoryid, creds))
+
+def list_tables(categoryid: int, creds: Dict[str, Any], schema: str):
+    return introspection_cache.get_or_load((categoryid, "tables", schema), lambda: _fetch_tables(categoryid, creds, schema))
+
+def schema_tree(categoryid: int, creds: Dict[str, Any], schema: Optional[str] = None):
+    """Schemas, tables and columns in one pg_catalog query"""
+    return introspection_cache.get_or_load((categoryid, "tree", schema), lambda: _fetch_schema_tree(categoryid, creds, schema))
+
+def invalidate_introspection(categoryid: int, schema: Optional[str] = None) -> int:
+    """Drop cached results for a category, or only those covering one schema"""
+    if schema is None:
+        return introspection_cache.invalidate(lambda key: key[0] == categoryid)
+    return introspection_cache.invalidate(lambda key: key[0] == categoryid and key[1] != "schemas" and key[2] in (schema, None))
@@ -0,0 +1,81 @@
+"""Serialization cost of the list endpoints: ORM + from_orm versus row dicts + one-pass encoding.
+
+Runs without a database: rows are synthesized in memory, so the numbers
+isolate the Python-side work that follows the query.
+
+    poetry run python -m benchmarks.bench_serialization --rows 10000 100000
+"""
+import argparse
+import json
+import random
+import string
+import sys
+import time
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+from app import encoding, models, schemas
+
+def synthetic_catalog_rows(count: int, columns_per_table: int = 20, seed: int = 42):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=8)) for _ in range(200)]
+    rows = []
+    for tableid in range(1, count + 1):
+        rows.append({
+            "table_vector_id": f"vec-{tableid}",
+            "table_name": f"table_{tableid}",
+            "table_description": " ".join(rng.choices(words, k=30)),
+            "rules": [{"rule": " ".join(rng.choices(words, k=6))} for _ in range(5)],
+            "usage_patterns": [" ".join(rng.choices(words, k=10)) for _ in range(3)],
+            "columns": [{"name": f"col_{i}", "type": "text", "description": " ".join(rng.choices(words, k=8))} for i in range(columns_per_table)],
+            "date_created": start + timedelta(minutes=tableid),
+            "date_updated": start + timedelta(minutes=tableid, seconds=30),
+            "archive": 0,
+            "tableid": tableid,
+        })
+    return rows
+
+def _time(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def run(count: int, repeat: int):
+    rows = synthetic_catalog_rows(count)
+
+    def orm_path():
+        # What the endpoints did before: ORM instances, from_orm per row, then
+        # FastAPI's jsonable_encoder and json.dumps over the whole payload.
+        instances = [models.Catalog(**row) for row in rows]
+        payload = {"dev": [schemas.Catalog.from_orm(i) for i in instances]}
+        return json.dumps(jsonable_encoder(payload)).encode()
+
+    def fast_path():
+        return encoding.dumps({"dev": rows})
+
+    orm_seconds, orm_body = _time(orm_path, repeat)
+    fast_seconds, fast_body = _time(fast_path, repeat)
+    assert json.loads(orm_body) == json.loads(fast_body), "fast path changed the response shape"
+    return {
+        "rows": count,
+        "orm_from_orm_seconds": round(orm_seconds, 4),
+        "fast_path_seconds": round(fast_seconds, 4),
+        "speedup": round(orm_seconds / fast_seconds, 1) if fast_seconds else None,
+        "encoder": "orjson" if encoding.orjson is not None else "json",
+        "payload_bytes": len(fast_body),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    results = [run(count, args.repeat) for count in args.rows]
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""End-to-end latency, throughput and memory of the main endpoints against a seeded dataset.
+
+Drives the app in-process through FastAPI's TestClient, so it talks to
+whatever DEV_DB_* / PROD_DB_* point at; seed those first with
+benchmarks.seed. Results are written as JSON, tagged with the git commit,
+so runs from different commits can be compared with --baseline.
+
+    poetry run python -m benchmarks.run --requests 200 --out results/$(git rev-parse --short HEAD).json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+from fastapi.testclient import TestClient
+from app import read_cache
+from app.main import app
+from .seed import SeedConfig
+
+SCENARIO_GROUPS = ("list", "sync", "audit", "documents")
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def scenarios(config: SeedConfig, rng: random.Random) -> Dict[str, Dict[str, Callable[[TestClient], Any]]]:
+    """Request factories by group; each call picks its own ids from the seeded ranges"""
+    def catalog_id():
+        return rng.randint(1, config.catalogs)
+
+    def context_id():
+        return rng.randint(1, config.contexts)
+
+    def latest_ids():
+        return [catalog_id() for _ in range(100)]
+
+    return {
+        "list": {
+            "GET /systems/": lambda c: c.get("/systems/"),
+            "GET /catalogs/?limit=100": lambda c: c.get("/catalogs/", params={"limit": 100, "after": catalog_id()}),
+            "GET /catalogs/?limit=1000&fields=...": lambda c: c.get("/catalogs/", params={"limit": 1000, "fields": "tableid,table_name,date_updated"}),
+            "GET /contexts/?limit=100": lambda c: c.get("/contexts/", params={"limit": 100, "after": context_id()}),
+        },
+        "sync": {
+            "POST /catalogs/sync/{id}": lambda c: c.post(f"/catalogs/sync/{catalog_id()}"),
+            "POST /catalogs/sync (100 ids)": lambda c: c.post("/catalogs/sync", json={"ids": [catalog_id() for _ in range(100)]}),
+            "POST /contexts/sync/{id}": lambda c: c.post(f"/contexts/sync/{context_id()}"),
+        },
+        "audit": {
+            "GET /audit/table/catalog": lambda c: c.get("/audit/table/catalog", params={"limit": 100}),
+            "GET /audit/history/catalog/{id}": lambda c: c.get(f"/audit/history/catalog/{catalog_id()}"),
+            "POST /audit/history/catalog/latest (100 ids)": lambda c: c.post("/audit/history/catalog/latest", json={"record_ids": latest_ids(), "limit": 5}),
+        },
+        "documents": {
+            "GET /catalogs/{id}/full (cold)": lambda c: _cold(lambda: c.get(f"/catalogs/{catalog_id()}/full")),
+            "GET /catalogs/{id}/full (warm)": lambda c: c.get(f"/catalogs/{rng.randint(1, min(config.catalogs, 50))}/full"),
+            "GET /contexts/{id}/full (cold)": lambda c: _cold(lambda: c.get(f"/contexts/{context_id()}/full")),
+        },
+    }
+
+def _cold(request):
+    read_cache.cache.clear()
+    return request()
+
+def measure(client: TestClient, request: Callable[[TestClient], Any], count: int, warmup: int) -> Dict[str, Any]:
+    for _ in range(warmup):
+        request(client)
+    latencies, statuses, payload = [], {}, 0
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    for _ in range(count):
+        request_start = time.perf_counter()
+        response = request(client)
+        latencies.append((time.perf_counter() - request_start) * 1000)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        payload += len(response.content)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    latencies.sort()
+    return {
+        "requests": count,
+        "statuses": {str(code): n for code, n in sorted(statuses.items())},
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else None,
+        "peak_memory_bytes": peak - baseline,
+        "mean_payload_bytes": payload // count if count else 0,
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Scenarios whose p95 got more than threshold (a fraction) slower than the baseline"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous and previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", nargs="+", choices=SCENARIO_GROUPS, default=list(SCENARIO_GROUPS))
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--catalogs", type=int, default=SeedConfig.catalogs, help="catalog rows the dataset was seeded with")
+    parser.add_argument("--contexts", type=int, default=SeedConfig.contexts, help="context rows the dataset was seeded with")
+    parser.add_argument("--out", help="write results JSON here as well as to stdout")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare p95 against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed p95 slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    config = SeedConfig(seed=args.seed, catalogs=args.catalogs, contexts=args.contexts)
+    rng = random.Random(args.seed)
+    groups = scenarios(config, rng)
+    results = {
+        "commit": git_commit(),
+        "ran_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "scenarios": {},
+    }
+    tracemalloc.start()
+    try:
+        with TestClient(app) as client:
+            for group in args.groups:
+                for name, request in groups[group].items():
+                    results["scenarios"][name] = dict(measure(client, request, args.requests, args.warmup), group=group)
+                    print(f"{name}: p95 {results['scenarios'][name]['p95_ms']}ms", file=sys.stderr)
+    finally:
+        tracemalloc.stop()
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
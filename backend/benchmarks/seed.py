@@ -0,0 +1,228 @@
+"""Seed the dev and prod databases with a reproducible synthetic autobi dataset.
+
+Targets the databases configured by the DEV_DB_* / PROD_DB_* variables, and
+drops and recreates the autobi schema in both. Refuses to touch a database
+whose name does not contain "bench" unless --force is given.
+
+    DEV_DB_NAME=autobi_bench_dev PROD_DB_NAME=autobi_bench_prod \
+        poetry run python -m benchmarks.seed --catalogs 100000 --contexts 20000
+"""
+import argparse
+import json
+import random
+import string
+import sys
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine, text
+from app import db, models, partitions
+
+INSERT_CHUNK = 2000
+
+@dataclass
+class SeedConfig:
+    seed: int = 42
+    systems: int = 10
+    roles_per_system: int = 5
+    categories_per_system: int = 5
+    catalogs: int = 10000
+    contexts: int = 2000
+    audit_rows: int = 100000
+    audit_days: int = 90
+    columns_per_table: int = 20
+    description_words: int = 30
+    prod_missing: float = 0.02
+    prod_changed: float = 0.05
+    audit_mode: str = "delta"
+
+class Generator:
+    def __init__(self, config: SeedConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.words = ["".join(self.rng.choices(string.ascii_lowercase, k=self.rng.randint(3, 10))) for _ in range(500)]
+        self.start = datetime(2024, 1, 1)
+
+    def text(self, words: int) -> str:
+        return " ".join(self.rng.choices(self.words, k=words))
+
+    def stamp(self, i: int) -> datetime:
+        return self.start + timedelta(minutes=i)
+
+    def systems(self):
+        for systemid in range(1, self.config.systems + 1):
+            yield {
+                "systemid": systemid, "systemname": f"system_{systemid}", "systemurl": f"https://system{systemid}.example.com",
+                "description": self.text(self.config.description_words), "domain": self.rng.choice(self.words),
+                "date_created": self.stamp(systemid), "date_updated": self.stamp(systemid), "status": "active",
+                "system_preferences": {"theme": self.rng.choice(self.words)},
+            }
+
+    def roles(self):
+        roleid = 0
+        for systemid in range(1, self.config.systems + 1):
+            for _ in range(self.config.roles_per_system):
+                roleid += 1
+                yield {
+                    "roleid": roleid, "rolename": f"role_{roleid}", "systemid": systemid,
+                    "description": self.text(self.config.description_words), "role_preferences": {"level": self.rng.randint(1, 5)},
+                    "date_created": self.stamp(roleid), "date_updated": self.stamp(roleid), "status": "active",
+                }
+
+    def categories(self):
+        categoryid = 0
+        for systemid in range(1, self.config.systems + 1):
+            for _ in range(self.config.categories_per_system):
+                categoryid += 1
+                yield {
+                    "categoryid": categoryid, "categoryname": f"category_{categoryid}", "systemid": systemid,
+                    "description": self.text(self.config.description_words),
+                    "category_preferences": json.dumps({"db_type": "postgres", "credentials": ""}),
+                    "date_created": self.stamp(categoryid), "date_updated": self.stamp(categoryid), "status": "active",
+                }
+
+    def columns(self):
+        return [
+            {"name": f"{self.rng.choice(self.words)}_{i}", "type": self.rng.choice(["text", "integer", "numeric", "timestamp"]),
+             "description": self.text(8)}
+            for i in range(self.config.columns_per_table)
+        ]
+
+    def catalogs(self):
+        for tableid in range(1, self.config.catalogs + 1):
+            yield {
+                "tableid": tableid, "table_vector_id": f"tv-{tableid}", "table_name": f"table_{tableid}",
+                "table_description": self.text(self.config.description_words),
+                "rules": [{"rule": self.text(6), "details": self.text(12)} for _ in range(5)],
+                "usage_patterns": [self.text(10) for _ in range(3)],
+                "columns": self.columns(),
+                "date_created": self.stamp(tableid), "date_updated": self.stamp(tableid), "archive": 0,
+            }
+
+    def catalog_mappings(self):
+        roles = self.config.systems * self.config.roles_per_system
+        categories = self.config.systems * self.config.categories_per_system
+        for tableid in range(1, self.config.catalogs + 1):
+            systemid = self.rng.randint(1, self.config.systems)
+            yield {"mappingid": tableid, "tableid": tableid, "roleid": self.rng.randint(1, roles),
+                   "categoryid": self.rng.randint(1, categories), "systemid": systemid}
+
+    def contexts(self):
+        for contextid in range(1, self.config.contexts + 1):
+            tables = [f"table_{self.rng.randint(1, max(self.config.catalogs, 1))}" for _ in range(5)]
+            yield {
+                "contextid": contextid, "context_vector_id": f"cv-{contextid}", "context_name": f"context_{contextid}",
+                "context_description": self.text(self.config.description_words),
+                "table_descriptions": {t: self.text(12) for t in tables},
+                "rules": [self.text(8) for _ in range(3)], "relevanttables": tables, "columns": self.columns(),
+                "context_rules": [self.text(8) for _ in range(3)],
+                "date_created": self.stamp(contextid), "date_updated": self.stamp(contextid), "archive": 0,
+            }
+
+    def audit(self):
+        today = datetime.utcnow().replace(microsecond=0)
+        tables = [("catalog", self.config.catalogs), ("context", self.config.contexts)]
+        for audit_id in range(1, self.config.audit_rows + 1):
+            table_name, count = self.rng.choice(tables)
+            yield {
+                "audit_id": audit_id, "table_name": table_name, "record_id": self.rng.randint(1, max(count, 1)),
+                "action": "UPDATE", "old_data": {"table_description": self.text(10)}, "new_data": {"table_description": self.text(10)},
+                "changed_by": f"user{self.rng.randint(1, 20)}",
+                "changed_at": today - timedelta(seconds=self.rng.randint(0, self.config.audit_days * 86400)),
+                "change_reason": None,
+            }
+
+def drift(rows, rng: random.Random, config: SeedConfig):
+    """Prod copy of dev rows: a few missing, a few with an older description"""
+    for row in rows:
+        roll = rng.random()
+        if roll < config.prod_missing:
+            continue
+        if roll < config.prod_missing + config.prod_changed:
+            row = dict(row, date_updated=row["date_updated"] - timedelta(days=1))
+            for field in ("description", "table_description", "context_description"):
+                if field in row:
+                    row[field] = "stale " + row[field]
+        yield row
+
+def remember(rows, key: str, seen: set):
+    """Pass rows through, adding each row's key to seen"""
+    for row in rows:
+        seen.add(row[key])
+        yield row
+
+def insert_rows(conn, model, rows) -> int:
+    table, count, chunk = model.__table__, 0, []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == INSERT_CHUNK:
+            conn.execute(table.insert(), chunk)
+            count, chunk = count + len(chunk), []
+    if chunk:
+        conn.execute(table.insert(), chunk)
+        count += len(chunk)
+    pk = table.primary_key.columns.values()[0].name
+    conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.fullname}', '{pk}'), coalesce(max({pk}), 0) + 1, false) FROM {table.fullname}"))
+    return count
+
+def reset_schema(conn, config: SeedConfig):
+    conn.execute(text("DROP SCHEMA IF EXISTS autobi CASCADE"))
+    conn.execute(text("CREATE SCHEMA autobi"))
+    models.Base.metadata.create_all(conn)
+    oldest = partitions.month_start((datetime.utcnow() - timedelta(days=config.audit_days)).date())
+    start = oldest
+    while start < partitions.month_start(date.today()):
+        partitions.create_partition(conn, start)
+        start = partitions.add_months(start, 1)
+    partitions.ensure_partitions(conn)
+
+def seed_environment(url: str, config: SeedConfig, env: str):
+    generator = Generator(config)
+    # Prod drifts from dev with its own, but still seeded, random stream.
+    rng = random.Random(config.seed + 1)
+    counts = {}
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        reset_schema(conn, config)
+        sources = [
+            (models.System, generator.systems()), (models.Role, generator.roles()), (models.Category, generator.categories()),
+            (models.Catalog, generator.catalogs()), (models.CatalogMapping, generator.catalog_mappings()), (models.Context, generator.contexts()),
+        ]
+        kept_catalogs = set()
+        for model, rows in sources:
+            if env == "prod" and model in (models.Catalog, models.Context):
+                rows = drift(rows, rng, config)
+            if env == "prod" and model is models.Catalog:
+                rows = remember(rows, "tableid", kept_catalogs)
+            if env == "prod" and model is models.CatalogMapping:
+                # Mappings of catalogs that drift dropped would break their foreign key.
+                rows = (row for row in rows if row["tableid"] in kept_catalogs)
+            counts[model.__tablename__] = insert_rows(conn, model, rows)
+        if env == "dev":
+            counts["table_audit"] = insert_rows(conn, models.TableAudit, generator.audit())
+        # Triggers go in after the bulk load so it is not audited row by row.
+        for statement in models.audit_ddl(config.audit_mode) + models.cache_notify_ddl():
+            conn.execute(text(statement))
+        conn.execute(text("ANALYZE"))
+    engine.dispose()
+    return counts
+
+def check_target(url: str, force: bool):
+    name = url.rsplit("/", 1)[-1]
+    if "bench" not in name and not force:
+        sys.exit(f"Refusing to reset database '{name}': its name does not contain 'bench' (use --force)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed dev and prod with a synthetic autobi dataset")
+    for field, default in asdict(SeedConfig()).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+    parser.add_argument("--force", action="store_true", help="allow databases whose name lacks 'bench'")
+    args = parser.parse_args(argv)
+    config = SeedConfig(**{field: getattr(args, field) for field in asdict(SeedConfig())})
+    for url in (db.DEV_DB_URL, db.PROD_DB_URL):
+        check_target(url, args.force)
+    report = {"config": asdict(config), "dev": seed_environment(db.DEV_DB_URL, config, "dev"), "prod": seed_environment(db.PROD_DB_URL, config, "prod")}
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
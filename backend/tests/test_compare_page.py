@@ -0,0 +1,53 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from app import main, models
+
+def page(keys, after, limit):
+    rows = [{"tableid": k} for k in keys if after is None or k > after]
+    return rows if limit is None else rows[:limit]
+
+class ComparePageTest(unittest.TestCase):
+    def compare(self, dev_keys, prod_keys, after=None, limit=None):
+        keys = {"dev": dev_keys, "prod": prod_keys}
+        dev_db, prod_db = SimpleNamespace(info={"env": "dev"}), SimpleNamespace(info={"env": "prod"})
+
+        def get_page_rows(session, model, columns, after, limit):
+            return page(keys[session.info["env"]], after, limit)
+
+        with mock.patch.object(main.crud, "get_page_rows", get_page_rows):
+            result = asyncio.run(main.compare_page(models.Catalog, ["tableid"], dev_db, prod_db, after, limit))
+        return {env: [r["tableid"] for r in rows] if env != "next_cursor" else rows for env, rows in result.items()}
+
+    def test_window_ends_at_smaller_last_key_of_full_pages(self):
+        # dev fills its page at 3, prod at 6: the window stops at 3 for both.
+        result = self.compare([1, 2, 3, 7], [2, 4, 6, 8], limit=3)
+        self.assertEqual(result, {"dev": [1, 2, 3], "prod": [2], "next_cursor": 3})
+
+    def test_short_page_is_cut_to_the_full_one(self):
+        result = self.compare([1, 2, 3, 4], [1, 5], limit=2)
+        self.assertEqual(result, {"dev": [1, 2], "prod": [1], "next_cursor": 2})
+
+    def test_last_page_has_no_cursor(self):
+        result = self.compare([1, 2, 3, 4], [2, 3, 4], after=2, limit=5)
+        self.assertEqual(result, {"dev": [3, 4], "prod": [3, 4], "next_cursor": None})
+
+    def test_pages_cover_every_key_once(self):
+        dev_keys, prod_keys = [1, 3, 4, 8, 9, 10, 15], [2, 3, 5, 6, 7, 8, 11, 12, 13, 14]
+        seen = {"dev": [], "prod": []}
+        after = None
+        while True:
+            result = self.compare(dev_keys, prod_keys, after=after, limit=3)
+            for env in seen:
+                seen[env] += result[env]
+            if result["next_cursor"] is None:
+                break
+            after = result["next_cursor"]
+        self.assertEqual(seen, {"dev": dev_keys, "prod": prod_keys})
+
+    def test_unpaged_response_has_no_cursor(self):
+        self.assertEqual(self.compare([1, 2], [2, 3]), {"dev": [1, 2], "prod": [2, 3]})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from app import diff, models
+
+class CompareFingerprintsTest(unittest.TestCase):
+    def test_classifies_ids(self):
+        dev = {1: "a", 2: "b", 3: "c", 5: "e"}
+        prod = {1: "a", 2: "x", 4: "d", 5: "e"}
+        self.assertEqual(diff.compare_fingerprints(dev, prod), {"added": [3], "removed": [4], "changed": [2], "unchanged": 2})
+
+    def test_empty_sides(self):
+        self.assertEqual(diff.compare_fingerprints({}, {2: "b", 1: "a"}), {"added": [], "removed": [1, 2], "changed": [], "unchanged": 0})
+        self.assertEqual(diff.compare_fingerprints({}, {}), {"added": [], "removed": [], "changed": [], "unchanged": 0})
+
+class FieldDeltasTest(unittest.TestCase):
+    def test_reports_only_differing_fields_keyed_by_env(self):
+        dev_db, prod_db = SimpleNamespace(info={"env": "dev"}), SimpleNamespace(info={"env": "qa"})
+        rows = {
+            "dev": [{"systemid": 1, "systemname": "a", "status": "active"}, {"systemid": 2, "systemname": "b"}],
+            "qa": [{"systemid": 1, "systemname": "a", "status": "retired"}],
+        }
+        with mock.patch.object(diff.crud, "get_rows_for_sync", lambda session, model, ids: rows[session.info["env"]]):
+            deltas = diff.field_deltas(models.System, dev_db, prod_db, [1, 2])
+        self.assertEqual(deltas[1], {"status": {"dev": "active", "qa": "retired"}})
+        # A row missing from one side differs in every field the other side set.
+        self.assertEqual(deltas[2], {"systemid": {"dev": 2, "qa": None}, "systemname": {"dev": "b", "qa": None}})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+from app import events
+
+def ids(backlog):
+    return [event["id"] for event in backlog]
+
+def parse(chunk: bytes):
+    fields = dict(line.split(": ", 1) for line in chunk.decode().splitlines() if ": " in line and not line.startswith(":"))
+    return int(fields["id"]) if "id" in fields else fields.get("event")
+
+class BrokerReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.broker = events.EventBroker(buffer_size=5)
+        for record_id in range(1, 8):
+            self.broker.publish("catalog" if record_id % 2 else "context", record_id, "prod" if record_id < 7 else "dev", "synced")
+
+    def test_no_last_event_id_starts_live(self):
+        _, backlog = self.broker.subscribe()
+        self.assertEqual(backlog, [])
+
+    def test_replays_buffered_events_after_last_event_id(self):
+        _, backlog = self.broker.subscribe(last_event_id=4)
+        self.assertEqual(ids(backlog), [5, 6, 7])
+
+    def test_replay_is_filtered_like_live_events(self):
+        _, backlog = self.broker.subscribe(entities={"catalog"}, envs={"prod"}, last_event_id=2)
+        self.assertEqual(ids(backlog), [3, 5])
+
+    def test_caught_up_client_gets_empty_backlog(self):
+        _, backlog = self.broker.subscribe(last_event_id=7)
+        self.assertEqual(backlog, [])
+
+    def test_oldest_buffered_event_is_still_replayable(self):
+        # Events 3..7 are buffered, so a client that saw 2 has missed nothing.
+        _, backlog = self.broker.subscribe(last_event_id=2)
+        self.assertEqual(ids(backlog), [3, 4, 5, 6, 7])
+
+    def test_id_older_than_buffer_needs_resync(self):
+        _, backlog = self.broker.subscribe(last_event_id=1)
+        self.assertIsNone(backlog)
+
+    def test_id_from_previous_process_needs_resync(self):
+        _, backlog = self.broker.subscribe(last_event_id=50)
+        self.assertIsNone(backlog)
+
+class StreamTest(unittest.TestCase):
+    def collect(self, run):
+        broker = events.EventBroker()
+        with mock.patch.object(events, "broker", broker), mock.patch.object(events, "EVENT_HEARTBEAT_SECONDS", 0.01):
+            chunks = asyncio.run(run(broker))
+        self.assertEqual(broker.stats()["subscribers"], 0)
+        return chunks
+
+    def test_events_both_replayed_and_queued_are_sent_once(self):
+        async def run(broker):
+            broker.bind(asyncio.get_running_loop())
+            other, _ = broker.subscribe()
+            broker.publish("catalog", 1, "prod", "synced")
+            broker.publish("catalog", 2, "prod", "synced")
+            # The reconnect lands after 1 and 2 are buffered but before their
+            # fan-outs run on the loop, so both are queued and 2 is also replayed.
+            subscriber, backlog = broker.subscribe(last_event_id=1)
+            await asyncio.sleep(0)
+            broker.publish("catalog", 3, "prod", "synced")
+            await asyncio.sleep(0)
+            broker.unsubscribe(other)
+            queued = subscriber.queue.qsize()
+            body = events.stream(subscriber, backlog)
+            chunks = [await body.__anext__() for _ in range(4)]
+            await body.aclose()
+            return ids(backlog), queued, chunks
+
+        backlog, queued, chunks = self.collect(run)
+        self.assertEqual((backlog, queued), ([2], 3))
+        self.assertEqual([parse(chunk) for chunk in chunks], [None, 2, 3, None])
+
+    def test_stale_backlog_starts_with_resync(self):
+        async def run(broker):
+            subscriber, _ = broker.subscribe()
+            body = events.stream(subscriber, None)
+            chunks = [await body.__anext__() for _ in range(2)]
+            await body.aclose()
+            return chunks
+
+        chunks = self.collect(run)
+        self.assertTrue(chunks[0].startswith(b"retry: "))
+        self.assertEqual(parse(chunks[1]), "resync")
+
+    def test_overflowed_subscriber_is_told_to_resync(self):
+        async def run(broker):
+            broker.bind(asyncio.get_running_loop())
+            with mock.patch.object(events, "EVENT_QUEUE_SIZE", 1):
+                subscriber, _ = broker.subscribe()
+            broker.publish("catalog", 1, "prod", "synced")
+            broker.publish("catalog", 2, "prod", "synced")
+            await asyncio.sleep(0)
+            return [chunk async for chunk in events.stream(subscriber, [])]
+
+        self.assertEqual([parse(chunk) for chunk in self.collect(run)], [None, 1, "resync"])
+
+class FormatEventTest(unittest.TestCase):
+    def test_id_goes_in_the_id_field(self):
+        chunk = events.format_event({"id": 12, "entity": "catalog", "record_id": 3, "env": "prod", "action": "synced", "version": None, "ts": 1.5})
+        lines = chunk.decode().split("\n")
+        self.assertEqual(lines[:2], ["id: 12", "event: change"])
+        self.assertEqual(json.loads(lines[2][len("data: "):]), {"entity": "catalog", "record_id": 3, "env": "prod", "action": "synced", "version": None, "ts": 1.5})
+        self.assertTrue(chunk.endswith(b"\n\n"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from unittest import mock
+from app import metrics
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        for name in ("_counters", "_histograms"):
+            patcher = mock.patch.object(metrics, name, {})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def lines(self, prefix):
+        return [line for line in metrics.render().splitlines() if line.startswith(prefix)]
+
+    def test_bucket_bounds_are_inclusive(self):
+        for value in (0.005, 0.0051, 10.0, 11.0):
+            metrics.observe("autobi_db_query_duration_seconds", value, env="dev")
+        counts = metrics._histograms[("autobi_db_query_duration_seconds", (("env", "dev"),))].counts
+        self.assertEqual((counts[0], counts[1], counts[-2], counts[-1]), (1, 1, 1, 1))
+
+    def test_histogram_renders_cumulative_buckets(self):
+        for value in (0.003, 0.2, 0.2, 7.0):
+            metrics.observe("autobi_db_query_duration_seconds", value, env="prod")
+        buckets = self.lines("autobi_db_query_duration_seconds_bucket")
+        self.assertEqual(len(buckets), len(metrics.BUCKETS) + 1)
+        self.assertEqual(buckets[0], 'autobi_db_query_duration_seconds_bucket{env="prod",le="0.005"} 1')
+        self.assertIn('autobi_db_query_duration_seconds_bucket{env="prod",le="0.25"} 3', buckets)
+        self.assertEqual(buckets[-1], 'autobi_db_query_duration_seconds_bucket{env="prod",le="+Inf"} 4')
+        self.assertEqual(self.lines("autobi_db_query_duration_seconds_count"), ['autobi_db_query_duration_seconds_count{env="prod"} 4'])
+
+    def test_counters_accumulate_per_label_set(self):
+        metrics.inc("autobi_db_queries_total", env="dev", route="/a")
+        metrics.inc("autobi_db_queries_total", route="/a", env="dev")
+        metrics.inc("autobi_db_queries_total", 3, route="/a", env="prod")
+        self.assertEqual(self.lines("autobi_db_queries_total"), [
+            'autobi_db_queries_total{env="dev",route="/a"} 2.0',
+            'autobi_db_queries_total{env="prod",route="/a"} 3.0',
+        ])
+
+    def test_gauges_are_replaced(self):
+        metrics.set_value("autobi_cache_entries", 5)
+        metrics.set_value("autobi_cache_entries", 2)
+        self.assertEqual(self.lines("autobi_cache_entries"), ["autobi_cache_entries 2"])
+
+    def test_label_values_are_escaped(self):
+        metrics.inc("autobi_slow_queries_total", env='a"b\\c\nd')
+        self.assertEqual(self.lines("autobi_slow_queries_total"), ['autobi_slow_queries_total{env="a\\"b\\\\c\\nd"} 1.0'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from datetime import date
+from unittest import mock
+from app import partitions
+
+class MonthArithmeticTest(unittest.TestCase):
+    def test_month_start(self):
+        self.assertEqual(partitions.month_start(date(2024, 2, 29)), date(2024, 2, 1))
+        self.assertEqual(partitions.month_start(date(2024, 12, 1)), date(2024, 12, 1))
+
+    def test_add_months_crosses_years(self):
+        self.assertEqual(partitions.add_months(date(2024, 11, 1), 1), date(2024, 12, 1))
+        self.assertEqual(partitions.add_months(date(2024, 12, 1), 1), date(2025, 1, 1))
+        self.assertEqual(partitions.add_months(date(2024, 1, 1), -1), date(2023, 12, 1))
+        self.assertEqual(partitions.add_months(date(2024, 3, 1), -15), date(2022, 12, 1))
+        self.assertEqual(partitions.add_months(date(2024, 3, 1), 25), date(2026, 4, 1))
+
+    def test_add_months_returns_month_start(self):
+        self.assertEqual(partitions.add_months(date(2024, 1, 31), 1), date(2024, 2, 1))
+        self.assertEqual(partitions.add_months(date(2024, 5, 17), 0), date(2024, 5, 1))
+
+    def test_partition_name_round_trips(self):
+        for start in (date(2024, 1, 1), date(2024, 10, 1), date(1999, 12, 1)):
+            match = partitions.PARTITION_NAME.match(partitions.partition_name(start))
+            self.assertEqual(date(int(match.group(1)), int(match.group(2)), 1), start)
+        self.assertIsNone(partitions.PARTITION_NAME.match("table_audit_default"))
+
+class FakeConn:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+
+def listed(*starts):
+    return [{"name": partitions.partition_name(s), "start": s, "end": partitions.add_months(s, 1)} for s in starts] + [
+        {"name": "table_audit_default", "start": None, "end": None},
+    ]
+
+class PartitionPlanningTest(unittest.TestCase):
+    def test_ensure_creates_missing_months_ahead(self):
+        conn = FakeConn()
+        with mock.patch.object(partitions, "list_partitions", return_value=listed(date(2024, 12, 1))):
+            created = partitions.ensure_partitions(conn, months_ahead=2, today=date(2024, 12, 15))
+        self.assertEqual(created, ["table_audit_y2025m01", "table_audit_y2025m02"])
+        self.assertIn("FROM ('2025-02-01') TO ('2025-03-01')", conn.statements[1])
+
+    def test_retention_takes_partitions_ended_before_the_window(self):
+        conn = FakeConn()
+        existing = listed(date(2024, 3, 1), date(2024, 1, 1), date(2024, 2, 1), date(2024, 4, 1))
+        with mock.patch.object(partitions, "list_partitions", return_value=existing):
+            report = partitions.apply_retention(conn, keep_months=2, mode="detach", today=date(2024, 4, 20))
+        # The window starts on 2024-02-01, so only January has ended before it.
+        self.assertEqual(report, [{"partition": "table_audit_y2024m01", "action": "detached"}])
+
+    def test_retention_runs_oldest_first(self):
+        conn = FakeConn()
+        existing = listed(date(2023, 12, 1), date(2023, 10, 1), date(2023, 11, 1))
+        with mock.patch.object(partitions, "list_partitions", return_value=existing), \
+                mock.patch.object(partitions, "compact_partition", return_value=0) as compact:
+            partitions.apply_retention(conn, keep_months=1, mode="compact", today=date(2024, 1, 5))
+        # December is still inside the one-month window that starts on 2023-12-01.
+        self.assertEqual([c.args[1] for c in compact.call_args_list], ["table_audit_y2023m10", "table_audit_y2023m11"])
+
+    def test_unknown_retention_mode(self):
+        with self.assertRaises(ValueError):
+            partitions.apply_retention(FakeConn(), mode="drop")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest import mock
+from app import read_cache
+
+class ListenerLifecycleTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(read_cache._listeners.clear)
+        self.addCleanup(read_cache.stop_listeners)
+
+    def test_stopped_listener_can_be_joined(self):
+        listener = read_cache.ChangeListener("dev")
+        with mock.patch.object(read_cache.ChangeListener, "run"):
+            listener.start()
+            listener.stop()
+            listener.join(1)
+        self.assertFalse(listener.is_alive())
+        self.assertTrue(listener.stopped)
+
+    def test_dead_listener_is_restarted(self):
+        started = []
+
+        def die(listener):
+            started.append(listener)
+
+        with mock.patch.object(read_cache.ChangeListener, "run", die):
+            self.assertFalse(read_cache._listening("dev"))
+            started[0].join(1)
+            self.assertFalse(read_cache._listening("dev"))
+            started[1].join(1)
+        self.assertEqual(len(started), 2)
+        self.assertIsNot(started[0], started[1])
+        self.assertIs(read_cache._listeners["dev"], started[1])
+
+    def test_stopped_listener_is_not_restarted(self):
+        with mock.patch.object(read_cache.ChangeListener, "run"):
+            read_cache._listening("dev")
+            read_cache.stop_listeners()
+            read_cache._listeners["dev"].join(1)
+            listener = read_cache._listeners["dev"]
+            self.assertFalse(read_cache._listening("dev"))
+        self.assertIs(read_cache._listeners["dev"], listener)
+
+    def test_unexpected_error_is_retried_in_place(self):
+        listener = read_cache.ChangeListener("dev")
+        calls = []
+
+        def connect(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                listener.stop()
+            raise RuntimeError("unexpected")
+
+        with mock.patch.object(read_cache.psycopg2, "connect", connect), \
+                mock.patch.object(read_cache, "LISTEN_RETRY_SECONDS", 0), \
+                mock.patch.object(read_cache.logger, "warning"):
+            listener.start()
+            listener.join(1)
+        self.assertFalse(listener.is_alive())
+        self.assertEqual(len(calls), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from app import reconcile
+
+MODEL = SimpleNamespace(__tablename__="catalog")
+
+class FakeTable:
+    """Rows of one environment by integer key; the helpers below checksum them like the SQL does"""
+
+    def __init__(self, rows):
+        self.rows = dict(rows)
+
+def key_bounds(session, model):
+    keys = session.rows.keys()
+    return (min(keys), max(keys), len(keys)) if keys else (None, None, 0)
+
+def bucket_checksums(session, model, ranges):
+    buckets = {}
+    for idx, (lo, hi, width) in enumerate(ranges, 1):
+        for key in sorted(session.rows):
+            if lo <= key < hi:
+                buckets.setdefault((idx, (key - lo) // width), []).append(hashlib.md5(session.rows[key].encode()).hexdigest())
+    return {bucket: (len(hashes), hashlib.md5("".join(hashes).encode()).hexdigest()) for bucket, hashes in buckets.items()}
+
+def row_checksums(session, model, ranges):
+    return {key: hashlib.md5(value.encode()).hexdigest() for key, value in session.rows.items() if any(lo <= key < hi for lo, hi in ranges)}
+
+class ReconcileTest(unittest.TestCase):
+    def setUp(self):
+        for name, func in (("key_bounds", key_bounds), ("bucket_checksums", bucket_checksums), ("row_checksums", row_checksums)):
+            patcher = mock.patch.object(reconcile, name, side_effect=func)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reconcile(self, dev, prod, **kwargs):
+        return asyncio.run(reconcile.reconcile(MODEL, FakeTable(dev), FakeTable(prod), **kwargs))
+
+    def test_narrows_to_the_differing_rows(self):
+        prod = {key: f"row {key}" for key in range(1, 10001)}
+        dev = dict(prod)
+        dev[10001] = "new row"
+        del dev[4242]
+        dev[777] = "edited row"
+        result = self.reconcile(dev, prod, fanout=16, leaf_rows=32)
+        self.assertEqual((result["added"], result["removed"], result["changed"]), ([10001], [4242], [777]))
+        self.assertFalse(result["in_sync"])
+        self.assertGreater(result["stats"]["levels"], 1)
+        # Only the leaves around the three differences are compared row by row.
+        self.assertLess(result["stats"]["rows_compared"], 3 * 2 * 32)
+
+    def test_identical_tables_stop_after_one_level(self):
+        rows = {key: f"row {key}" for key in range(1, 1001)}
+        result = self.reconcile(rows, dict(rows))
+        self.assertTrue(result["in_sync"])
+        self.assertEqual(result["stats"]["levels"], 1)
+        self.assertEqual(result["stats"]["rows_compared"], 0)
+
+    def test_empty_environment_reports_every_row(self):
+        result = self.reconcile({}, {1: "a", 2: "b"})
+        self.assertEqual(result["removed"], [1, 2])
+        self.assertEqual((result["source_rows"], result["target_rows"]), (0, 2))
+
+    def test_both_empty(self):
+        result = self.reconcile({}, {})
+        self.assertTrue(result["in_sync"])
+        self.assertEqual(result["stats"]["levels"], 0)
+
+    def test_differences_beyond_max_diffs_are_truncated(self):
+        result = self.reconcile({key: "x" for key in range(1, 51)}, {}, max_diffs=10)
+        self.assertEqual(result["added"], list(range(1, 11)))
+        self.assertTrue(result["truncated"])
+
+if __name__ == "__main__":
+    unittest.main()
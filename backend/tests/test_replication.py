@@ -0,0 +1,45 @@
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+from app import replication
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+CUTOFF = NOW - timedelta(seconds=replication.REPLICATION_LAG_SECONDS)
+
+def entry(audit_id, seconds_before_cutoff):
+    return SimpleNamespace(audit_id=audit_id, record_id=audit_id, changed_at=CUTOFF - timedelta(seconds=seconds_before_cutoff))
+
+class FakeDevSession:
+    """Answers read_changes' cutoff query, then returns the audit entries it was given"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.statements = []
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+        if len(self.statements) == 1:
+            return mock.Mock(scalar=mock.Mock(return_value=CUTOFF))
+        return mock.Mock(all=mock.Mock(return_value=self.entries))
+
+WATERMARK = {"last_audit_id": 0, "last_changed_at": None}
+
+class ReadChangesTest(unittest.TestCase):
+    def test_batch_stops_before_first_young_entry(self):
+        # 101 was written early by a long transaction, 102 is too young, 103
+        # is old again: the watermark must not move past 102.
+        entries = [entry(100, 20), entry(101, 10), entry(102, -1), entry(103, 5)]
+        changes = replication.read_changes(FakeDevSession(entries), "catalog", WATERMARK, 10)
+        self.assertEqual([c.audit_id for c in changes], [100, 101])
+
+    def test_young_first_entry_yields_nothing(self):
+        changes = replication.read_changes(FakeDevSession([entry(100, -5), entry(101, 5)]), "catalog", WATERMARK, 10)
+        self.assertEqual(changes, [])
+
+    def test_old_entries_are_returned_whole(self):
+        entries = [entry(100, 20), entry(101, 10)]
+        self.assertEqual(replication.read_changes(FakeDevSession(entries), "catalog", WATERMARK, 10), entries)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+import psycopg2
+from psycopg2 import extensions
+from app import sources
+
+CREDS = {"database": "source", "user": "reader", "password": "secret", "host": "localhost", "port": 5432}
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for the pool: statements outside
+    autocommit open a transaction, and set_session refuses to run inside one"""
+
+    fail_autocommit = False
+
+    def __init__(self, *args, **kwargs):
+        self.closed = 0
+        self.broken = False
+        self.in_transaction = False
+        self._autocommit = False
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        if self.in_transaction or self.fail_autocommit:
+            raise psycopg2.ProgrammingError("set_session cannot be used inside a transaction")
+        self._autocommit = value
+
+    @property
+    def info(self):
+        status = extensions.TRANSACTION_STATUS_INTRANS if self.in_transaction else extensions.TRANSACTION_STATUS_IDLE
+        return SimpleNamespace(transaction_status=status)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        if not self.conn.autocommit:
+            self.conn.in_transaction = True
+
+class SourcePoolRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = sources.SourcePoolRegistry(max_connections=2)
+        connect = mock.patch("psycopg2.pool.psycopg2.connect", side_effect=FakeConnection)
+        self.connect = connect.start()
+        self.addCleanup(connect.stop)
+        # Health-check every checkout, as happens for fresh connections.
+        healthcheck = mock.patch.object(sources, "SOURCE_HEALTHCHECK_SECONDS", 0)
+        healthcheck.start()
+        self.addCleanup(healthcheck.stop)
+        self.addCleanup(self.registry.close_all)
+
+    def checked_out(self):
+        return sum(len(entry.pool._used) for entry in self.registry._pools.values())
+
+    def test_checkouts_beyond_maxconn_reuse_connections(self):
+        for _ in range(self.registry.max_connections * 3):
+            with self.registry.connection(1, CREDS) as conn, conn.cursor() as cur:
+                self.assertTrue(conn.autocommit)
+                cur.execute("SELECT 1")
+        self.assertEqual(self.checked_out(), 0)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_unhealthy_connection_is_replaced(self):
+        with self.registry.connection(1, CREDS) as first:
+            pass
+        first.broken = True
+        with self.registry.connection(1, CREDS) as second:
+            self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+        self.assertEqual(self.checked_out(), 0)
+
+    def test_failed_checkout_returns_its_connection(self):
+        with mock.patch.object(FakeConnection, "fail_autocommit", True):
+            for _ in range(self.registry.max_connections + 1):
+                with self.assertRaises(psycopg2.ProgrammingError):
+                    with self.registry.connection(1, CREDS):
+                        pass
+        self.assertEqual(self.checked_out(), 0)
+        with self.registry.connection(1, CREDS) as conn:
+            self.assertTrue(conn.autocommit)
+
+if __name__ == "__main__":
+    unittest.main()
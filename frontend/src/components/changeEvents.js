@@ -0,0 +1,24 @@
+import { useEffect, useRef } from 'react';
+
+// Subscribes to the backend's /events stream for the given entities (e.g. 'catalogs').
+// onChange gets every change event; onResync is called when events were missed
+// and the page should reload its data.
+export const useChangeEvents = (entities, onChange, onResync) => {
+  const apiUrl = process.env.REACT_APP_API_URL;
+  const handlers = useRef({ onChange, onResync });
+  handlers.current = { onChange, onResync };
+
+  useEffect(() => {
+    const source = new EventSource(`${apiUrl}/events?entities=${entities}`);
+    source.addEventListener('change', (e) => handlers.current.onChange(JSON.parse(e.data)));
+    source.addEventListener('resync', () => handlers.current.onResync());
+    return () => source.close();
+  }, [apiUrl, entities]);
+};
+
+// Applies a change event to merged dev/prod rows; rows that are not loaded are left alone.
+export const patchRows = (rows, event, idKey) => rows.map(row => row[idKey] !== event.record_id ? row : {
+  ...row,
+  [`${event.env}_present`]: event.action !== 'deleted',
+  [`${event.env}_updated`]: event.action === 'deleted' ? '' : event.version || '',
+});
@@ -71,19 +71,16 @@ const AdminPage = () => {
   };
 
   const handleAddSystem = (values) => {
-    axios.post(`${apiUrl}/systems/`, values).then(() => {
-      axios.get(`${apiUrl}/systems/`).then(res => setSystems(res.data.dev || []));
+    axios.post(`${apiUrl}/systems/`, values).then(res => {
+      // The response is the created system; no need to re-fetch the dev/prod comparison.
+      setSystems(prevState => [...prevState, res.data]);
       form.resetFields();
     }).catch(error => console.error("Error adding system:", error));
   };
 
   const handleAddRole = (values) => {
-    axios.post(`${apiUrl}/roles/`, { ...values, systemid: selectedSystem.systemid }).then(() => {
-      // Re-fetch roles for the current system after adding
-      axios.get(`${apiUrl}/roles/by_system/${selectedSystem.systemid}`).then(res => {
-          console.log(`Fetched Roles after adding (API response data.dev) for system ${selectedSystem.systemid}:`, res.data.dev);
-          setRoles(prevState => res.data.dev || []); // Functional update
-      }).catch(error => console.error(`Error fetching roles after adding for system ${selectedSystem.systemid}:`, error));
+    axios.post(`${apiUrl}/roles/`, { ...values, systemid: selectedSystem.systemid }).then(res => {
+      setRoles(prevState => [...prevState, res.data]); // The response is the created role
       setRoleModal(false);
       roleForm.resetFields();
     }).catch(error => console.error("Error adding role:", error));
@@ -106,12 +103,8 @@ const AdminPage = () => {
       description: values.description,
       db_type: dbType,
       db_creds,
-    }).then(() => {
-      // Re-fetch categories for the current system after adding
-      axios.get(`${apiUrl}/categories/by_system/${selectedSystem.systemid}`).then(res => {
-           console.log(`Fetched Categories after adding (API response data.dev) for system ${selectedSystem.systemid}:`, res.data.dev);
-          setCategories(prevState => res.data.dev || []); // Functional update
-      }).catch(error => console.error(`Error fetching categories after adding for system ${selectedSystem.systemid}:`, error));
+    }).then(res => {
+      setCategories(prevState => [...prevState, res.data]); // The response is the created category
       setCategoryModal(false);
       categoryForm.resetFields();
     }).catch(error => console.error("Error adding category:", error));
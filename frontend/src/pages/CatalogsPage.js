@@ -1,9 +1,20 @@
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import axios from 'axios';
 import EntityTable from '../components/EntityTable';
+import { useChangeEvents, patchRows } from '../components/changeEvents';
 import { Modal, Table, Tag, Drawer, Button } from 'antd';
 import ReactJson from 'react-json-view';
 
+const mergeRow = (id, devItem, prodItem) => ({
+  ...devItem,
+  ...prodItem,
+  tableid: id,
+  dev_present: !!devItem,
+  prod_present: !!prodItem,
+  dev_updated: devItem?.date_updated || '',
+  prod_updated: prodItem?.date_updated || '',
+});
+
 const CatalogsPage = () => {
   const [data, setData] = useState([]);
   const [historyVisible, setHistoryVisible] = useState(false);
@@ -14,32 +25,34 @@ const CatalogsPage = () => {
   const [drawerLoading, setDrawerLoading] = useState(false);
   const apiUrl = process.env.REACT_APP_API_URL;
 
-  useEffect(() => {
-    axios.get(`${apiUrl}/catalogs/`).then(res => {
+  const load = useCallback(() => {
+    axios.get(`${apiUrl}/catalogs/`, { params: { fields: 'table_vector_id,table_name,table_description,date_created,date_updated,archive' } }).then(res => {
       const dev = res.data.dev || [];
       const prod = res.data.prod || [];
       const allIds = Array.from(new Set([...dev.map(d => d.tableid), ...prod.map(p => p.tableid)]));
-      const merged = allIds.map(id => {
-        const devItem = dev.find(d => d.tableid === id);
-        const prodItem = prod.find(p => p.tableid === id);
-        return {
-          ...devItem,
-          ...prodItem,
-          tableid: id,
-          dev_present: !!devItem,
-          prod_present: !!prodItem,
-          dev_updated: devItem?.date_updated || '',
-          prod_updated: prodItem?.date_updated || '',
-        };
-      });
+      const merged = allIds.map(id => mergeRow(id, dev.find(d => d.tableid === id), prod.find(p => p.tableid === id)));
       setData(merged);
     });
   }, [apiUrl]);
 
+  useEffect(load, [load]);
+
+  // Sync and create events patch rows in place instead of reloading both lists.
+  useChangeEvents('catalogs', (event) => {
+    if (event.action !== 'deleted' && !data.some(row => row.tableid === event.record_id)) {
+      // A record this page has not loaded yet: fetch just that one.
+      axios.get(`${apiUrl}/catalogs/${event.record_id}`).then(res => {
+        const row = mergeRow(event.record_id, res.data.dev, res.data.prod);
+        setData(rows => rows.some(r => r.tableid === row.tableid) ? rows.map(r => r.tableid === row.tableid ? row : r) : [...rows, row]);
+      });
+      return;
+    }
+    setData(rows => patchRows(rows, event, 'tableid'));
+  }, load);
+
   const handleSync = (id) => {
-    axios.post(`${apiUrl}/catalogs/sync/${id}`).then(() => {
-      window.location.reload();
-    });
+    // The resulting change event updates the row.
+    axios.post(`${apiUrl}/catalogs/sync/${id}`);
   };
 
   const handleHistory = (tableid) => {
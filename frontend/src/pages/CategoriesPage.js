@@ -1,37 +1,46 @@
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import axios from 'axios';
 import EntityTable from '../components/EntityTable';
+import { useChangeEvents, patchRows } from '../components/changeEvents';
+
+const mergeRow = (id, devItem, prodItem) => ({
+  ...devItem,
+  ...prodItem,
+  categoryid: id,
+  dev_present: !!devItem,
+  prod_present: !!prodItem,
+  dev_updated: devItem?.date_updated || '',
+  prod_updated: prodItem?.date_updated || '',
+});
 
 const CategoriesPage = () => {
   const [data, setData] = useState([]);
   const apiUrl = process.env.REACT_APP_API_URL;
 
-  useEffect(() => {
+  const load = useCallback(() => {
     axios.get(`${apiUrl}/categories/`).then(res => {
       const dev = res.data.dev || [];
       const prod = res.data.prod || [];
       const allIds = Array.from(new Set([...dev.map(d => d.categoryid), ...prod.map(p => p.categoryid)]));
-      const merged = allIds.map(id => {
-        const devItem = dev.find(d => d.categoryid === id);
-        const prodItem = prod.find(p => p.categoryid === id);
-        return {
-          ...devItem,
-          ...prodItem,
-          categoryid: id,
-          dev_present: !!devItem,
-          prod_present: !!prodItem,
-          dev_updated: devItem?.date_updated || '',
-          prod_updated: prodItem?.date_updated || '',
-        };
-      });
+      const merged = allIds.map(id => mergeRow(id, dev.find(d => d.categoryid === id), prod.find(p => p.categoryid === id)));
       setData(merged);
     });
   }, [apiUrl]);
 
+  useEffect(load, [load]);
+
+  // Sync and create events patch rows in place instead of reloading both lists.
+  useChangeEvents('categories', (event) => {
+    if (event.action !== 'deleted' && !data.some(row => row.categoryid === event.record_id)) {
+      load();
+      return;
+    }
+    setData(rows => patchRows(rows, event, 'categoryid'));
+  }, load);
+
   const handleSync = (id) => {
-    axios.post(`${apiUrl}/categories/sync/${id}`).then(() => {
-      window.location.reload();
-    });
+    // The resulting change event updates the row.
+    axios.post(`${apiUrl}/categories/sync/${id}`);
   };
 
   return (
@@ -1,9 +1,20 @@
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import axios from 'axios';
 import EntityTable from '../components/EntityTable';
+import { useChangeEvents, patchRows } from '../components/changeEvents';
 import { Modal, Table, Tag, Drawer, Button } from 'antd';
 import ReactJson from 'react-json-view';
 
+const mergeRow = (id, devItem, prodItem) => ({
+  ...devItem,
+  ...prodItem,
+  contextid: id,
+  dev_present: !!devItem,
+  prod_present: !!prodItem,
+  dev_updated: devItem?.date_updated || '',
+  prod_updated: prodItem?.date_updated || '',
+});
+
 const ContextsPage = () => {
   const [data, setData] = useState([]);
   const [historyVisible, setHistoryVisible] = useState(false);
@@ -14,32 +25,34 @@ const ContextsPage = () => {
   const [drawerLoading, setDrawerLoading] = useState(false);
   const apiUrl = process.env.REACT_APP_API_URL;
 
-  useEffect(() => {
-    axios.get(`${apiUrl}/contexts/`).then(res => {
+  const load = useCallback(() => {
+    axios.get(`${apiUrl}/contexts/`, { params: { fields: 'context_vector_id,context_name,context_description,date_created,date_updated,archive' } }).then(res => {
       const dev = res.data.dev || [];
       const prod = res.data.prod || [];
       const allIds = Array.from(new Set([...dev.map(d => d.contextid), ...prod.map(p => p.contextid)]));
-      const merged = allIds.map(id => {
-        const devItem = dev.find(d => d.contextid === id);
-        const prodItem = prod.find(p => p.contextid === id);
-        return {
-          ...devItem,
-          ...prodItem,
-          contextid: id,
-          dev_present: !!devItem,
-          prod_present: !!prodItem,
-          dev_updated: devItem?.date_updated || '',
-          prod_updated: prodItem?.date_updated || '',
-        };
-      });
+      const merged = allIds.map(id => mergeRow(id, dev.find(d => d.contextid === id), prod.find(p => p.contextid === id)));
       setData(merged);
     });
   }, [apiUrl]);
 
+  useEffect(load, [load]);
+
+  // Sync and create events patch rows in place instead of reloading both lists.
+  useChangeEvents('contexts', (event) => {
+    if (event.action !== 'deleted' && !data.some(row => row.contextid === event.record_id)) {
+      // A record this page has not loaded yet: fetch just that one.
+      axios.get(`${apiUrl}/contexts/${event.record_id}`).then(res => {
+        const row = mergeRow(event.record_id, res.data.dev, res.data.prod);
+        setData(rows => rows.some(r => r.contextid === row.contextid) ? rows.map(r => r.contextid === row.contextid ? row : r) : [...rows, row]);
+      });
+      return;
+    }
+    setData(rows => patchRows(rows, event, 'contextid'));
+  }, load);
+
   const handleSync = (id) => {
-    axios.post(`${apiUrl}/contexts/sync/${id}`).then(() => {
-      window.location.reload();
-    });
+    // The resulting change event updates the row.
+    axios.post(`${apiUrl}/contexts/sync/${id}`);
   };
 
   const handleHistory = (contextid) => {
@@ -1,37 +1,46 @@
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import axios from 'axios';
 import EntityTable from '../components/EntityTable';
+import { useChangeEvents, patchRows } from '../components/changeEvents';
+
+const mergeRow = (id, devItem, prodItem) => ({
+  ...devItem,
+  ...prodItem,
+  roleid: id,
+  dev_present: !!devItem,
+  prod_present: !!prodItem,
+  dev_updated: devItem?.date_updated || '',
+  prod_updated: prodItem?.date_updated || '',
+});
 
 const RolesPage = () => {
   const [data, setData] = useState([]);
   const apiUrl = process.env.REACT_APP_API_URL;
 
-  useEffect(() => {
+  const load = useCallback(() => {
     axios.get(`${apiUrl}/roles/`).then(res => {
       const dev = res.data.dev || [];
       const prod = res.data.prod || [];
       const allIds = Array.from(new Set([...dev.map(d => d.roleid), ...prod.map(p => p.roleid)]));
-      const merged = allIds.map(id => {
-        const devItem = dev.find(d => d.roleid === id);
-        const prodItem = prod.find(p => p.roleid === id);
-        return {
-          ...devItem,
-          ...prodItem,
-          roleid: id,
-          dev_present: !!devItem,
-          prod_present: !!prodItem,
-          dev_updated: devItem?.date_updated || '',
-          prod_updated: prodItem?.date_updated || '',
-        };
-      });
+      const merged = allIds.map(id => mergeRow(id, dev.find(d => d.roleid === id), prod.find(p => p.roleid === id)));
       setData(merged);
     });
   }, [apiUrl]);
 
+  useEffect(load, [load]);
+
+  // Sync and create events patch rows in place instead of reloading both lists.
+  useChangeEvents('roles', (event) => {
+    if (event.action !== 'deleted' && !data.some(row => row.roleid === event.record_id)) {
+      load();
+      return;
+    }
+    setData(rows => patchRows(rows, event, 'roleid'));
+  }, load);
+
   const handleSync = (id) => {
-    axios.post(`${apiUrl}/roles/sync/${id}`).then(() => {
-      window.location.reload();
-    });
+    // The resulting change event updates the row.
+    axios.post(`${apiUrl}/roles/sync/${id}`);
   };
 
   return (
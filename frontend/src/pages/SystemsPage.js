@@ -1,38 +1,47 @@
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import axios from 'axios';
 import EntityTable from '../components/EntityTable';
+import { useChangeEvents, patchRows } from '../components/changeEvents';
+
+const mergeRow = (id, devItem, prodItem) => ({
+  ...devItem,
+  ...prodItem,
+  systemid: id,
+  dev_present: !!devItem,
+  prod_present: !!prodItem,
+  dev_updated: devItem?.date_updated || '',
+  prod_updated: prodItem?.date_updated || '',
+});
 
 const SystemsPage = () => {
   const [data, setData] = useState([]);
   const apiUrl = process.env.REACT_APP_API_URL;
 
-  useEffect(() => {
+  const load = useCallback(() => {
     axios.get(`${apiUrl}/systems/`).then(res => {
       const dev = res.data.dev || [];
       const prod = res.data.prod || [];
       // Merge dev and prod by systemid
       const allIds = Array.from(new Set([...dev.map(d => d.systemid), ...prod.map(p => p.systemid)]));
-      const merged = allIds.map(id => {
-        const devItem = dev.find(d => d.systemid === id);
-        const prodItem = prod.find(p => p.systemid === id);
-        return {
-          ...devItem,
-          ...prodItem,
-          systemid: id,
-          dev_present: !!devItem,
-          prod_present: !!prodItem,
-          dev_updated: devItem?.date_updated || '',
-          prod_updated: prodItem?.date_updated || '',
-        };
-      });
+      const merged = allIds.map(id => mergeRow(id, dev.find(d => d.systemid === id), prod.find(p => p.systemid === id)));
       setData(merged);
     });
   }, [apiUrl]);
 
+  useEffect(load, [load]);
+
+  // Sync and create events patch rows in place instead of reloading both lists.
+  useChangeEvents('systems', (event) => {
+    if (event.action !== 'deleted' && !data.some(row => row.systemid === event.record_id)) {
+      load();
+      return;
+    }
+    setData(rows => patchRows(rows, event, 'systemid'));
+  }, load);
+
   const handleSync = (id) => {
-    axios.post(`${apiUrl}/systems/sync/${id}`).then(() => {
-      window.location.reload();
-    });
+    // The resulting change event updates the row.
+    axios.post(`${apiUrl}/systems/sync/${id}`);
   };
 
   return (